@@ -0,0 +1,100 @@
+"""This module implements an asyncio interface for ILI9341 displays.
+
+All the conversion work and blocking bus writes happen in the background
+update thread of the wrapped display, so the event loop stays responsive.
+
+"""
+
+import asyncio
+
+
+class AsyncIli9341(object):
+    """Class to drive an `Ili9341Base` display from asyncio code."""
+
+    def __init__(self, lcd):
+        """Initialize AsyncIli9341 class.
+
+        Args:
+
+        - lcd: (Ili9341Base) The display to drive. Any IO library backend
+          works.
+
+        """
+        self._lcd = lcd
+        self._last_future = None
+
+    @property
+    def lcd(self):
+        """The wrapped `Ili9341Base` display."""
+        return self._lcd
+
+    @property
+    def framebuff(self):
+        """The framebuffer of the wrapped display."""
+        return self._lcd.framebuff
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def present(self, frame=None, regions=None):
+        """Request a display update without waiting for it.
+
+        If `frame` is given, it is copied into the framebuffer first. If
+        `regions` is given, only those (x, y, w, h) areas are sent, as with
+        `Ili9341Base.update()`. A frame
+        still waiting to be sent is replaced by this one, so requests coming
+        faster than the bus can drain them are coalesced, and only the latest
+        frame is sent.
+
+        Returns an asyncio future, resolving to `True` once the frame is sent
+        or to `False` if it was superseded by a newer frame.
+
+        """
+        if frame is not None:
+            self._lcd.framebuff[...] = frame
+
+        # Never block the event loop while waiting for a pending frame.
+        future = asyncio.wrap_future(
+            self._lcd.update_async(policy="drop", regions=regions))
+        self._last_future = future
+        return future
+
+    async def update(self, regions=None):
+        """Update display, waiting until the frame is sent.
+
+        Returns `True` if the frame was sent, or `False` if it was superseded
+        by a newer frame before being sent.
+
+        """
+        return await self.present(regions=regions)
+
+    async def clear(self, color=(0, 0, 0)):
+        """Clear display with a specific color."""
+        self._lcd.framebuff[...] = color
+        return await self.update()
+
+    async def drain(self):
+        """Wait until all the requested frames are sent."""
+        if self._last_future is not None:
+            await asyncio.shield(self._last_future)
+
+    async def sink(self, frames):
+        """Send frames from an async iterable to the display.
+
+        Frames arriving while the bus is busy are coalesced, so the producer
+        is never slowed down by the display. Returns once the iterable is
+        exhausted and the last frame is sent.
+
+        """
+        async for frame in frames:
+            self.present(frame)
+
+        await self.drain()
+
+    async def close(self):
+        """Send any remaining frame and stop the background update thread."""
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._lcd.stop_async)
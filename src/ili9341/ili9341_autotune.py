@@ -0,0 +1,102 @@
+"""This module implements a runtime auto-tuner for ILI9341 display parameters.
+
+The tuner times real display updates while trying out candidate values for
+each parameter, one parameter at a time, and settles on the values giving the
+best measured framerate.
+
+"""
+
+import statistics
+
+
+class Ili9341AutoTuner(object):
+    """Class to tune `Ili9341Base` parameters using measured update times."""
+
+    def __init__(
+            self,
+            lcd,
+            candidates,
+            frames_per_trial=10,
+            n_rounds=3):
+        """Initialize Ili9341AutoTuner class.
+
+        Args:
+
+        - lcd: (Ili9341Base) The display to tune.
+
+        - candidates: (list) A list of (<param-name>, <candidate-values>)
+          tuples. Parameters are tuned in the given order, each one with the
+          previously tuned ones pinned to their best values. Parameter names
+          must be settable properties of the display.
+
+        - frames_per_trial: (int) Number of updates to time in a row, with the
+          same candidate value.
+
+        - n_rounds: (int) Number of times to cycle through all the candidate
+          values of a parameter. Interleaving the trials this way evens out
+          changes in the workload while tuning.
+
+        """
+        if frames_per_trial < 1 or n_rounds < 1:
+            raise ValueError(
+                "Frames per trial and number of rounds must be positive!")
+
+        self._lcd = lcd
+        self._candidates = [(name, list(values)) for name, values in candidates]
+        self._frames_per_trial = frames_per_trial
+        self._n_rounds = n_rounds
+
+        self._results = {}
+        self._stage = -1
+        self._next_stage()
+
+    @property
+    def done(self):
+        """Whether all the parameters are tuned."""
+        return self._stage >= len(self._candidates)
+
+    @property
+    def results(self):
+        """A dictionary mapping each tuned parameter to another dictionary,
+        which maps each candidate value to its measured framerate."""
+        return self._results
+
+    def _next_stage(self):
+        self._stage += 1
+        if self.done:
+            return
+
+        name, values = self._candidates[self._stage]
+        self._samples = {v: [] for v in values}
+        self._schedule = values * self._n_rounds
+        self._trial = 0
+        self._n_frames = 0
+        setattr(self._lcd, name, self._schedule[0])
+
+    def record(self, elapsed):
+        """Record the time taken by an update, in seconds."""
+        if self.done:
+            return
+
+        name, values = self._candidates[self._stage]
+        self._samples[self._schedule[self._trial]].append(elapsed)
+
+        self._n_frames += 1
+        if self._n_frames < self._frames_per_trial:
+            return
+
+        # Move on to the next trial.
+        self._n_frames = 0
+        self._trial += 1
+        if self._trial < len(self._schedule):
+            setattr(self._lcd, name, self._schedule[self._trial])
+            return
+
+        # All trials of this parameter are done, pin the fastest value.
+        fps = {
+            v: 1.0 / max(statistics.median(t), 1e-9)
+            for v, t in self._samples.items()}
+        self._results[name] = fps
+        setattr(self._lcd, name, max(fps, key=fps.get))
+
+        self._next_stage()
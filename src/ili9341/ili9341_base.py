@@ -3,8 +3,14 @@ This module implements a pure python driver for spi-connected ILI9341 LCD displa
 """
 
 import numpy as np
-import math
 import time
+import threading
+import contextlib
+import concurrent.futures
+
+from .ili9341_autotune import Ili9341AutoTuner
+from .ili9341_stats import Ili9341UpdateStats
+from .ili9341_sprite import Ili9341Sprite, Ili9341SpriteCache, content_key
 
 # Constants for interacting with display registers.
 ILI9341_TFTWIDTH    = 320
@@ -38,7 +44,9 @@ ILI9341_RAMWR       = 0x2C
 ILI9341_RAMRD       = 0x2E
 
 ILI9341_PTLAR       = 0x30
+ILI9341_VSCRDEF     = 0x33
 ILI9341_MADCTL      = 0x36
+ILI9341_VSCRSADD    = 0x37
 ILI9341_PIXFMT      = 0x3A
 
 # Memory access contrl (MADCTL) flags.
@@ -82,15 +90,164 @@ ILI9341_MAGENTA     = 0xF81F
 ILI9341_YELLOW      = 0xFFE0
 ILI9341_WHITE       = 0xFFFF
 
+# MADCTL flags giving each supported rotation, relative to the default
+# landscape orientation.
+ROTATION_MADCTL_FLAGS = {
+    0: 0,
+    90: ILI9341_MADCTL_ROW_COL_EXCHANGE | ILI9341_MADCTL_ROW_ACCESS_REVERSED,
+    180: ILI9341_MADCTL_COL_ACCESS_REVERSED | ILI9341_MADCTL_ROW_ACCESS_REVERSED,
+    270: ILI9341_MADCTL_ROW_COL_EXCHANGE | ILI9341_MADCTL_COL_ACCESS_REVERSED,
+}
+
+ROTATION_MADCTL_MASK = (
+    ILI9341_MADCTL_ROW_COL_EXCHANGE |
+    ILI9341_MADCTL_COL_ACCESS_REVERSED |
+    ILI9341_MADCTL_ROW_ACCESS_REVERSED)
+
+# Policies for handling a new asynchronous update while another one is
+# still pending.
+ASYNC_UPDATE_POLICIES = ("drop", "block")
+
+# Partial update merging modes.
+PARTIAL_UPDATE_MERGE_MODES = ("distance", "cost")
+
+# Ways of detecting the changed areas of a frame.
+CHANGE_DETECTION_MODES = ("diff", "tile_hash")
+
+# Tile sizes usable with tile hash change detection. Tiles must evenly divide
+# the display and span whole 32-bit words of framebuffer data, i.e. groups of
+# 4 pixels.
+TILE_HASH_SIZES = (4, 8, 16, 20, 40, 80)
+
+# Constants of the splitmix64 finalizer, mixing the words of tiles.
+TILE_HASH_MIX_SHIFTS = (np.uint64(30), np.uint64(27), np.uint64(31))
+TILE_HASH_MIX_MULTIPLIERS = (
+    np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+
+# Bus cost of setting up a partial update window: the PASET, CASET and RAMWR
+# command bytes along with their 8 parameter bytes, sent in 5 SPI transactions
+# and requiring 6 DC/X line writes.
+PARTIAL_UPDATE_SETUP_BYTES = 11
+PARTIAL_UPDATE_SETUP_TRANSACTIONS = 5 + 6
+
+# Maximum number of rectangles to consider for cost based merging, before
+# falling back to coarser distance based merging.
+COST_MERGE_MAX_RECTS = 128
+
+
+def _make_rgb565_wire_luts():
+    """Create lookup tables mapping 8-bit red, green and blue values to their
+    contribution in an RGB565 pixel, stored in wire (big-endian) byte order.
+
+    The tables can be ORed together, as their bits do not overlap.
+
+    """
+    v = np.arange(256, dtype=np.uint16)
+    luts = np.stack(((v >> 3) << 11, (v >> 2) << 5, v >> 3))
+    return luts.astype(">u2").view(np.uint16)
+
+
+RGB565_WIRE_LUTS = _make_rgb565_wire_luts()
+
+
+def _convert_to_wire(pixels, out, tmp):
+    """Convert (<height>, <width>, <rgb-color>) pixels to wire order RGB565
+    values in `out`, using `tmp` as scratch space of the same shape."""
+    # Look up each channel's contribution and merge them together.
+    np.take(RGB565_WIRE_LUTS[0], pixels[:, :, 0], out=out)
+    np.take(RGB565_WIRE_LUTS[1], pixels[:, :, 1], out=tmp)
+    out |= tmp
+    np.take(RGB565_WIRE_LUTS[2], pixels[:, :, 2], out=tmp)
+    out |= tmp
+
+
+def _to_panel_madctl(madctl_cmd_val):
+    """Translate a MADCTL value to the one sent to the panel.
+
+    MADCTL values are given for framebuffer pixel (y, x) landing on GRAM page
+    x and column y, i.e. for GRAM filled in column-major framebuffer order.
+    Toggling the row/column exchange bit, and swapping the row and column
+    reversal bits to match, shows the same image with the GRAM filled in
+    row-major order instead. Windows of the framebuffer can then be sent
+    without transposing them.
+
+    """
+    val = madctl_cmd_val & ~ROTATION_MADCTL_MASK
+    if not madctl_cmd_val & ILI9341_MADCTL_ROW_COL_EXCHANGE:
+        val |= ILI9341_MADCTL_ROW_COL_EXCHANGE
+    if madctl_cmd_val & ILI9341_MADCTL_ROW_ACCESS_REVERSED:
+        val |= ILI9341_MADCTL_COL_ACCESS_REVERSED
+    if madctl_cmd_val & ILI9341_MADCTL_COL_ACCESS_REVERSED:
+        val |= ILI9341_MADCTL_ROW_ACCESS_REVERSED
+    return val & 0xFF
+
+
+def _rotated_madctl(madctl_cmd_val, rotation):
+    """Replace the orientation flags of a MADCTL value with those of a
+    rotation."""
+    if rotation not in ROTATION_MADCTL_FLAGS:
+        raise ValueError(
+            "Rotation must be one of: {}".format(
+                ", ".join(str(r) for r in ROTATION_MADCTL_FLAGS)))
+
+    return (
+        (madctl_cmd_val & ~ROTATION_MADCTL_MASK) |
+        ROTATION_MADCTL_FLAGS[rotation])
+
+
+def _palette_to_wire(palette):
+    """Convert an (<n-colors>, <rgb-color>) palette to a lookup table of 256
+    wire order RGB565 values. Entries past the palette are black."""
+    palette = np.asarray(palette, dtype=np.uint8)
+    wire = np.zeros(256, dtype=np.uint16)
+    n = len(palette)
+    for c in range(3):
+        wire[:n] |= RGB565_WIRE_LUTS[c][palette[:, c]]
+    return wire
+
+
+def _as_byte_view(buff):
+    """Return a flat byte memoryview of `buff`, avoiding copies whenever
+    `buff` supports the buffer protocol."""
+    try:
+        return memoryview(buff).cast("B")
+    except TypeError:
+        return memoryview(bytearray(buff))
+
 
 class Ili9341Base(object):
     """IO library agnostic base class for controlling ILI9341 SPI displays."""
 
+    # Approximate cost of a single SPI transaction or DC/X line write, in
+    # terms of equivalent bytes on the wire. Subclasses should override this
+    # to reflect the latency of their IO library.
+    DEFAULT_TRANSACTION_COST_BYTES = 64
+
+    # Candidate values to try when auto-tuning. Chunk sizes must be safe to
+    # use with the IO library.
+    AUTOTUNE_CHUNK_SIZES = (512, 1024, 2048, 4096)
+    AUTOTUNE_MERGE_DISTS = (1, 2, 5, 10, 20, 40)
+
     def __init__(
             self,
             spi_data_chunk_size=2048,
             partial_update_merge_dist=5,
-            madctl_cmd_val=ILI9341_MADCTL_BGR_MODE):
+            madctl_cmd_val=ILI9341_MADCTL_BGR_MODE,
+            partial_update_merge_mode="distance",
+            transaction_cost_bytes=None,
+            async_update_policy="drop",
+            scroll_detection=False,
+            scroll_detection_max_lines=64,
+            validate_damage=False,
+            change_detection="diff",
+            tile_size=16,
+            spi_clock_hz=None,
+            collect_stats=False,
+            stats_window=100,
+            stats_callback=None,
+            palette=None,
+            rotation=None,
+            sprite_cache_bytes=1 << 20):
         """Initialize Ili9341Base class.
 
         Args:
@@ -105,34 +262,253 @@ class Ili9341Base(object):
 
         - madctl_cmd_val: (int-flags) This is a bitmask that can be used to
           rotate/flip the display image. Look at the ILI9341 datasheet for
-          more.
+          more. The flags are relative to the default landscape orientation,
+          where the row/column exchange flag gives a portrait framebuffer.
+          The driver translates the value so that the display memory is
+          filled in framebuffer memory order.
+
+        - partial_update_merge_mode: (str) How to merge partial updates. With
+          "distance", updates closer than `partial_update_merge_dist` are
+          merged. With "cost", updates are merged whenever it reduces the
+          estimated bus cost, counting both pixel payload and the per-window
+          command overhead.
+
+        - transaction_cost_bytes: (int) Cost of a single SPI transaction or
+          DC/X line write in equivalent bytes, used by the "cost" merging
+          mode. If `None`, a default suitable for the IO library is used.
+
+        - async_update_policy: (str) What `update_async()` does when an
+          earlier frame is still waiting for the background thread. With
+          "drop", the stale pending frame is replaced by the new one. With
+          "block", the call waits until the pending frame is picked up.
+
+        - scroll_detection: (bool) If enabled, each update checks whether the
+          new frame is the previous one shifted along the scroll axis. If so,
+          the display is scrolled in hardware and only the newly exposed
+          lines are sent. See `scroll()`. Needs "diff" change detection.
+
+        - scroll_detection_max_lines: (int) The largest shift to look for
+          when detecting scrolls.
+
+        - validate_damage: (bool) If enabled, updates with declared damage
+          regions still compare the whole frame, and raise `RuntimeError` if
+          anything changed outside the declared regions. Meant for debugging
+          only, as it defeats the purpose of declaring damage. With
+          "tile_hash" change detection, changes are only located to a tile.
+
+        - change_detection: (str) How updates find the changed areas. With
+          "diff", each frame is converted to RGB565 and compared pixel by
+          pixel against the last sent one, which is kept. With "tile_hash",
+          a digest of each tile of the framebuffer is compared against the
+          digest of the same tile when last sent instead, and only the
+          changed tiles are converted. No copy of the sent frame is kept,
+          and small changes cost less, but changes are sent as whole tiles,
+          and hashing costs more than comparing when most of the frame
+          changes.
+
+        - tile_size: (int) Width and height of the tiles, in pixels, with
+          "tile_hash" change detection. Must be one of 4, 8, 16, 20, 40 or 80.
+
+        - spi_clock_hz: (int) SPI clock frequency, in Hz. IO library backends
+          pass the configured one. Used to compute bus utilization.
+
+        - collect_stats: (bool) Whether to record statistics of each update.
+          See `stats`.
+
+        - stats_window: (int) Number of most recent updates to compute the
+          statistics from.
+
+        - stats_callback: (callable) If given, called after each update with
+          a dictionary describing it. See `Ili9341UpdateStats` class for the
+          fields. Implies `collect_stats`.
+
+        - palette: (array) If given, the display runs in indexed color mode
+          with this (<n-colors>, <rgb-color>) palette of up to 256 colors. The
+          framebuffer then holds a palette index per pixel, changes are found
+          on the indices, and only the sent areas are expanded to RGB565. See
+          `set_palette()`.
+
+        - rotation: (int) If given, overrides the orientation flags of
+          `madctl_cmd_val`. See `set_rotation()`.
+
+        - sprite_cache_bytes: (int) Maximum memory held by images converted
+          for `blit()`, in bytes.
 
         """
-        self._height = ILI9341_TFTHEIGHT
-        self._width = ILI9341_TFTWIDTH
+        if partial_update_merge_mode not in PARTIAL_UPDATE_MERGE_MODES:
+            raise ValueError(
+                "Partial update merge mode must be one of: {}".format(
+                    ", ".join(PARTIAL_UPDATE_MERGE_MODES)))
+
+        if async_update_policy not in ASYNC_UPDATE_POLICIES:
+            raise ValueError(
+                "Async update policy must be one of: {}".format(
+                    ", ".join(ASYNC_UPDATE_POLICIES)))
+
+        if change_detection not in CHANGE_DETECTION_MODES:
+            raise ValueError(
+                "Change detection mode must be one of: {}".format(
+                    ", ".join(CHANGE_DETECTION_MODES)))
+
+        if change_detection == "tile_hash" and tile_size not in TILE_HASH_SIZES:
+            raise ValueError(
+                "Tile size must be one of: {}".format(
+                    ", ".join(str(t) for t in TILE_HASH_SIZES)))
+
+        if change_detection == "tile_hash" and scroll_detection:
+            raise ValueError(
+                "Scroll detection compares whole frames, and needs \"diff\""
+                " change detection!")
+
+        if transaction_cost_bytes is None:
+            transaction_cost_bytes = self.DEFAULT_TRANSACTION_COST_BYTES
+
+        if rotation is not None:
+            madctl_cmd_val = _rotated_madctl(madctl_cmd_val, rotation)
+
         self._spi_data_chunk_size = spi_data_chunk_size
         self._partial_update_merge_dist = partial_update_merge_dist
         self._madctl_cmd_val = madctl_cmd_val
+        self._partial_update_merge_mode = partial_update_merge_mode
+        self._transaction_cost_bytes = transaction_cost_bytes
+
+        # Palette as RGB565 wire values, and the palette entries whose color
+        # changed since the last update, in indexed color mode.
+        # ---------------------------------------------------------------,
+        self._palette = None
+        self._palette_wire = None
+        self._stale_indices = None
+        if palette is not None:
+            self._palette = self._check_palette(palette)
+            self._palette_wire = _palette_to_wire(self._palette)
+        # ---------------------------------------------------------------'
+
+        # Per-tile digests of the framebuffer last sent, for "tile_hash"
+        # change detection, which keeps no other copy of it. Each word of a
+        # tile is offset by a fixed random key for its position and mixed,
+        # and the results are summed. Unlike a plain weighted sum, mixing
+        # leaves no structure for two changed words to cancel out.
+        # ---------------------------------------------------------------,
+        self._change_detection = change_detection
+        self._tile_size = tile_size
+        self._tile_keys = None
+        if change_detection == "tile_hash":
+            n_channels = 3 if palette is None else 1
+            rng = np.random.default_rng(0x9341)
+            self._tile_keys = rng.integers(
+                0, 1 << 64, size=(tile_size, tile_size * n_channels // 4),
+                dtype=np.uint64)
+        # ---------------------------------------------------------------'
+
+        self._alloc_buffers()
+        self._forget_sent_frame()
+
+        self._invalidate_bus_state()
+        self._bus_batch_depth = 0
+
+        # Running totals of what was put on the bus.
+        self._n_bus_bytes = 0
+        self._n_bus_transactions = 0
+        self._n_dc_toggles = 0
+
+        self._spi_clock_hz = spi_clock_hz
+        self._stats = None
+        self._stats_callback = stats_callback
+        if collect_stats or stats_callback is not None:
+            self._stats = Ili9341UpdateStats(spi_clock_hz, stats_window)
+
+        self._autotuner = None
+
+        self._sprite_cache = Ili9341SpriteCache(sprite_cache_bytes)
+
+        self._scroll_detection = scroll_detection
+        self._scroll_detection_max_lines = scroll_detection_max_lines
+        self._reset_scroll_state()
+
+        # Damage regions declared with `invalidate()` since the last update,
+        # as inclusive (x1, y1, x2, y2) rectangles.
+        self._damage = []
+        self._validate_damage = validate_damage
+
+        # Serializes updates done from the calling and the background thread.
+        self._update_lock = threading.RLock()
+
+        # State of the background update thread, started on first use.
+        # ------------------------------------------------------------,
+        self._async_update_policy = async_update_policy
+        self._async_cond = threading.Condition()
+        self._async_thread = None
+        self._async_stopping = False
+
+        # (<framebuffer-snapshot>, <future>, <damage>) waiting for the thread.
+        self._async_pending = None
+
+        # The frame being sent by the thread, if any.
+        self._async_running = None
+
+        # Snapshot buffers available for reuse.
+        self._async_spare_buffs = []
+        # ------------------------------------------------------------'
+
+        self.reset()
+        self.init_display()
+
+    def _alloc_buffers(self):
+        """Allocate the framebuffer and the work buffers, sized for the
+        orientation set by the MADCTL value."""
+        if self._madctl_cmd_val & ILI9341_MADCTL_ROW_COL_EXCHANGE:
+            self._height, self._width = ILI9341_TFTWIDTH, ILI9341_TFTHEIGHT
+        else:
+            self._height, self._width = ILI9341_TFTHEIGHT, ILI9341_TFTWIDTH
 
-        self._buffer_shape = (self._height, self._width, 3)
+        if self._palette is None:
+            self._buffer_shape = (self._height, self._width, 3)
+        else:
+            self._buffer_shape = (self._height, self._width)
 
         # The framebuffer to display.
         self._framebuff = np.zeros(self._buffer_shape, dtype=np.uint8)
 
-        # Create an array as a sketch pad for color conversion.
-        self._workbuff = np.zeros(self._buffer_shape, dtype=np.uint16)
-
-        self._old_data = None
+        # Tile hash change detection works on the framebuffer itself, and
+        # only converts the areas it sends.
+        if self._tile_keys is not None:
+            self._rgb565_buffs = None
+            self._rgb565_scratch = None
+            self._diff_mask = None
+            return
+
+        # Create arrays to hold RGB565 converted frames. One of them holds the
+        # frame last sent to the display, while the other one is converted
+        # into. An extra scratch array is used during the conversion. In
+        # indexed color mode, they hold palette indices instead, and no
+        # conversion is needed.
+        # ---------------------------------------------------------------,
+        if self._palette is None:
+            self._rgb565_buffs = [
+                np.zeros((self._height, self._width), dtype=np.uint16),
+                np.zeros((self._height, self._width), dtype=np.uint16)]
+            self._rgb565_scratch = np.zeros(
+                (self._height, self._width), dtype=np.uint16)
+        else:
+            self._rgb565_buffs = [
+                np.zeros((self._height, self._width), dtype=np.uint8),
+                np.zeros((self._height, self._width), dtype=np.uint8)]
+            self._rgb565_scratch = None
+        # ---------------------------------------------------------------'
 
-        self.reset()
-        self.init_display()
+        # Reused to hold the changed pixels found by "diff" change detection.
+        self._diff_mask = np.zeros((self._height, self._width), dtype=bool)
 
     @property
     def framebuff(self):
         """A numpy array to hold pixel values.
 
         User should modify pixel values directly using this. The layout is:
-        (<height>, <width>, <rgb-color>)
+        (<height>, <width>, <rgb-color>), or (<height>, <width>) holding
+        palette indices in indexed color mode.
+
+        An assigned uint8 array of this shape is used as is, without copying.
+        It may be a view into a larger array.
 
         """
         return self._framebuff
@@ -140,11 +516,150 @@ class Ili9341Base(object):
     @framebuff.setter
     def framebuff(self, new_buff):
         # Convert buffer to an array, if necessary.
-        new_buff = np.array(new_buff, dtype=np.uint8).reshape(
-            (self._height, self._width, 3))
+        new_buff = np.asarray(new_buff, dtype=np.uint8).reshape(
+            self._buffer_shape)
 
         self._framebuff = new_buff
 
+    @property
+    def palette(self):
+        """The (<n-colors>, <rgb-color>) palette in indexed color mode, or
+        `None`."""
+        return None if self._palette is None else self._palette.copy()
+
+    def _check_palette(self, palette):
+        palette = np.array(palette, dtype=np.uint8)
+        if palette.ndim != 2 or palette.shape[1] != 3 or not (
+                1 <= len(palette) <= 256):
+            raise ValueError(
+                "Palette must be an array of 1 to 256 RGB colors!")
+        return palette
+
+    def set_palette(self, palette):
+        """Replace the palette in indexed color mode.
+
+        The next update repaints the pixels showing the palette entries whose
+        color changed, along with any other changes. Frames already queued
+        with `update_async()` are sent with the new palette.
+
+        """
+        if self._palette is None:
+            raise RuntimeError("Display is not in indexed color mode!")
+
+        palette = self._check_palette(palette)
+        wire = _palette_to_wire(palette)
+
+        with self._update_lock:
+            stale = wire != self._palette_wire
+            if self._stale_indices is not None:
+                stale |= self._stale_indices
+
+            self._palette = palette
+            self._palette_wire = wire
+            self._stale_indices = stale if stale.any() else None
+
+            # Converted sprites have the old colors.
+            if self._stale_indices is not None:
+                self._sprite_cache.clear()
+
+    @property
+    def sprite_cache(self):
+        """The `Ili9341SpriteCache` holding the images converted for
+        `blit()`."""
+        return self._sprite_cache
+
+    @property
+    def spi_clock_hz(self):
+        """SPI clock frequency in Hz, or `None` if unknown."""
+        return self._spi_clock_hz
+
+    @property
+    def stats(self):
+        """Statistics of the recent updates, as an `Ili9341UpdateStats`
+        object, or `None` if not collected."""
+        return self._stats
+
+    @property
+    def spi_data_chunk_size(self):
+        """Size of each SPI data transaction, zero if chunking is disabled."""
+        return self._spi_data_chunk_size
+
+    @spi_data_chunk_size.setter
+    def spi_data_chunk_size(self, value):
+        self._spi_data_chunk_size = value
+
+    @property
+    def partial_update_merge_dist(self):
+        """The distance to look for when merging partial updates."""
+        return self._partial_update_merge_dist
+
+    @partial_update_merge_dist.setter
+    def partial_update_merge_dist(self, value):
+        self._partial_update_merge_dist = value
+
+    @property
+    def tuned_params(self):
+        """The current values of the auto-tunable parameters, as a dictionary
+        of keyword arguments which can be pinned in configuration."""
+        return {
+            "spi_data_chunk_size": self._spi_data_chunk_size,
+            "partial_update_merge_dist": self._partial_update_merge_dist,
+        }
+
+    @property
+    def autotuning(self):
+        """Whether auto-tuning is in progress."""
+        return self._autotuner is not None and not self._autotuner.done
+
+    def _autotune_chunk_sizes(self):
+        """Return the chunk sizes to try when auto-tuning."""
+        return self.AUTOTUNE_CHUNK_SIZES
+
+    def start_autotuning(
+            self,
+            chunk_sizes=None,
+            merge_dists=None,
+            frames_per_trial=10,
+            n_rounds=3):
+        """Start tuning the SPI data chunk size and the partial update merge
+        distance, using the timings of the following updates.
+
+        Candidate values are tried in turn while the application keeps
+        calling `update()` as usual. Once done, the values giving the best
+        measured framerate are kept and can be read from `tuned_params`.
+
+        Args:
+
+        - chunk_sizes: (list) SPI data chunk sizes to try. If `None`, sizes
+          known to be safe with the IO library are used.
+
+        - merge_dists: (list) Partial update merge distances to try. If
+          `None`, a default set is used.
+
+        - frames_per_trial: (int) Number of updates to time in a row with
+          each candidate value. Updates not sending anything are not counted.
+
+        - n_rounds: (int) Number of times to cycle through the candidates.
+
+        Returns the `Ili9341AutoTuner` instance, which also reports the
+        measured framerate of each candidate.
+
+        """
+        if chunk_sizes is None:
+            chunk_sizes = self._autotune_chunk_sizes()
+        if merge_dists is None:
+            merge_dists = self.AUTOTUNE_MERGE_DISTS
+
+        with self._update_lock:
+            self._autotuner = Ili9341AutoTuner(
+                self,
+                [("spi_data_chunk_size", chunk_sizes),
+                 ("partial_update_merge_dist", merge_dists)],
+                frames_per_trial=frames_per_trial,
+                n_rounds=n_rounds)
+
+        return self._autotuner
+
     def _spi_write(self, buff):
         raise NotImplementedError
 
@@ -157,33 +672,107 @@ class Ili9341Base(object):
     def _do_hardware_reset(self):
         raise NotImplementedError
 
-    def send_cmd(self, buff):
+    def _flush_bus(self):
+        """Send out any queued bus operations.
+
+        IO libraries which queue up SPI writes and DC/X line changes should
+        override this. It is called at the end of each outermost bus batch.
+
+        """
+        pass
+
+    @contextlib.contextmanager
+    def _bus_batch(self):
+        """Group the bus operations done inside into a single batch."""
+        self._bus_batch_depth += 1
+        try:
+            yield
+        finally:
+            self._bus_batch_depth -= 1
+            if self._bus_batch_depth == 0:
+                self._flush_bus()
+
+    def _enter_ctrl_mode(self):
+        if self._dcx_mode != "ctrl":
+            self._switch_to_ctrl_mode()
+            self._dcx_mode = "ctrl"
+            self._n_dc_toggles += 1
+
+    def _enter_data_mode(self):
+        if self._dcx_mode != "data":
+            self._switch_to_data_mode()
+            self._dcx_mode = "data"
+            self._n_dc_toggles += 1
+
+    def _bus_write(self, buff):
+        """Write to the SPI bus, counting what was written."""
+        self._spi_write(buff)
+        self._n_bus_bytes += len(buff)
+        self._n_bus_transactions += 1
+
+    def _invalidate_bus_state(self):
+        """Forget the cached DC/X line level and address window, so that they
+        are set explicitly next time."""
+        self._dcx_mode = None
+        self._addr_window = {ILI9341_PASET: None, ILI9341_CASET: None}
+
+    def send_cmd(self, buff, data=None):
         """Send a composite command.
 
         The first byte is assumed to be a command. Rest of the bytes are
-        assumed to be data.
+        assumed to be data. Alternatively, the data can be given separately
+        as `data`, in which case `buff` must only hold the command byte.
 
         """
-        buff = bytearray(buff)
+        buff = _as_byte_view(buff)
+        if data is not None and len(buff) > 1:
+            raise ValueError(
+                "Command data must either follow the command byte or be"
+                " given separately, not both!")
+
+        # Forget the cached address window, if affected by this command.
+        if buff[0] in (ILI9341_SWRESET, ILI9341_MADCTL):
+            self._addr_window = {ILI9341_PASET: None, ILI9341_CASET: None}
+        elif buff[0] in self._addr_window:
+            self._addr_window[buff[0]] = None
+
+        with self._bus_batch():
+            # Send the command byte.
+            self._enter_ctrl_mode()
+            self._bus_write(buff[:1])
+
+            # Send the data that comes after command, if any.
+            data = buff[1:] if data is None else _as_byte_view(data)
+            if len(data) > 0:
+                self.send_data(data)
+
+    def _set_addr_range(self, cmd, start, end):
+        """Send a PASET or CASET command, unless the display already has the
+        same address range set."""
+        if self._addr_window[cmd] != (start, end):
+            self.send_cmd(bytearray([
+                cmd, start >> 8, start & 0xFF, end >> 8, end & 0xFF]))
+            self._addr_window[cmd] = (start, end)
+
+    def send_data(self, buff):
+        """Send data following a command, in chunks.
+
+        `buff` can be any object supporting the buffer protocol, e.g. a
+        C-contiguous numpy array. Chunks are sent as memoryview slices, so the
+        data is never copied.
 
-        # Send the command byte.
-        self._switch_to_ctrl_mode()
-        self._spi_write(buff[:1])
+        """
+        buff = _as_byte_view(buff)
 
-        # Send the data that comes after command in chunks.
-        # -----------------------------------------------------,
-        self._switch_to_data_mode()
-        s = self._spi_data_chunk_size
+        with self._bus_batch():
+            self._enter_data_mode()
+            s = self._spi_data_chunk_size
 
-        if s > 0:
-            n_chunks = math.ceil(len(buff[1:]) / s)
-            i = 0
-            while i < n_chunks:
-                self._spi_write(buff[(1 + i * s):(1 + (i + 1) * s)])
-                i += 1
-        else:
-            self._spi_write(buff[1:])
-        # -----------------------------------------------------'
+            if s > 0:
+                for i in range(0, len(buff), s):
+                    self._bus_write(buff[i:(i + s)])
+            else:
+                self._bus_write(buff)
 
     def init_display(self):
         """Initialize the display."""
@@ -201,7 +790,7 @@ class Ili9341Base(object):
             bytearray([ILI9341_VMCTR1, 0x3e, 0x28]),
             bytearray([ILI9341_VMCTR2, 0x86]),
             # bytearray([ILI9341_MADCTL, 0x84]),
-            bytearray([ILI9341_MADCTL, self._madctl_cmd_val & 0xFF]),
+            bytearray([ILI9341_MADCTL, _to_panel_madctl(self._madctl_cmd_val)]),
 
             bytearray([ILI9341_PIXFMT, 0x55]),
             bytearray([ILI9341_FRMCTR1, 0x00, 0x18]),
@@ -225,100 +814,1063 @@ class Ili9341Base(object):
         """Reset the display."""
         # Do a hardware reset if possible before a software reset.
         self._do_hardware_reset()
+        self._invalidate_bus_state()
         self.send_cmd(bytearray([ILI9341_SWRESET]))
+        self._reset_scroll_state()
 
-    def _find_updated_cols(self, top, bot, diff):
-        areas = []
-        cols = np.where(diff[top:(bot + 1), :].sum(axis=0) > 0)[0]
-        for i, curr_col in enumerate(cols):
-            prev_col = cols[i - 1] if i > 0 else curr_col
-            if i == 0:
-                left = right = curr_col
+        # Display contents are lost, so the next update must repaint all.
+        self._forget_sent_frame()
 
-            if i == (len(cols) - 1):
-                areas.append((left, top, curr_col, bot))
+    def _forget_sent_frame(self):
+        """Forget what the display shows, so the next update repaints it
+        all."""
+        self._old_data = None
+        self._old_digests = None
 
-            elif curr_col >= (prev_col + self._partial_update_merge_dist):
-                areas.append((left, top, right, bot))
-                left = right = curr_col
+    def _has_sent_frame(self):
+        """Whether the display contents are known, so updates can send only
+        what changed."""
+        if self._tile_keys is not None:
+            return self._old_digests is not None
+        return self._old_data is not None
 
-            else:
-                right = curr_col
+    @property
+    def rotation(self):
+        """The clockwise rotation of the display image in degrees, or `None`
+        if the MADCTL value mirrors the image instead."""
+        flags = self._madctl_cmd_val & ROTATION_MADCTL_MASK
+        for rotation, rotation_flags in ROTATION_MADCTL_FLAGS.items():
+            if flags == rotation_flags:
+                return rotation
+        return None
+
+    def set_rotation(self, rotation):
+        """Rotate the display image clockwise by 0, 90, 180 or 270 degrees.
+
+        The framebuffer always holds the image upright, so its shape is
+        (240, 320) in landscape rotations (0 and 180 degrees) and (320, 240)
+        in portrait ones. A new framebuffer is allocated when the shape
+        changes. Any scroll area is reset, and the next update repaints
+        everything.
+
+        """
+        madctl_cmd_val = _rotated_madctl(self._madctl_cmd_val, rotation)
+
+        # Frames queued in the old orientation are sent first.
+        if self._async_thread is not None:
+            self.wait_async()
+
+        with self._update_lock:
+            self._madctl_cmd_val = madctl_cmd_val
+            self.send_cmd(bytearray(
+                [ILI9341_MADCTL, _to_panel_madctl(madctl_cmd_val)]))
 
-            i += 1
+            portrait = bool(madctl_cmd_val & ILI9341_MADCTL_ROW_COL_EXCHANGE)
+            if portrait != (self._height > self._width):
+                self._alloc_buffers()
+                self._async_spare_buffs = []
 
-        return areas
+            self._damage = []
+            self._stale_indices = None
 
-    def _find_updated_rows(self, diff):
-        areas = []
-        rows = np.where(diff.sum(axis=1) > 0)[0]
-        for i, curr_row in enumerate(rows):
-            prev_row = rows[i - 1] if i > 0 else curr_row
-            if i == 0:
-                top = bot = curr_row
+            # The scroll axis may have changed too.
+            self.set_scroll_area()
+            self._forget_sent_frame()
+
+    def _scroll_axis(self):
+        """Return the framebuffer axis along which the display scrolls, and
+        whether display lines run opposite to the framebuffer coordinates.
+
+        Hardware scrolling always moves along the 320 GRAM pages, which are
+        addressed by CASET when rows and columns are exchanged, and by PASET
+        otherwise.
+
+        """
+        panel_madctl = _to_panel_madctl(self._madctl_cmd_val)
+        if panel_madctl & ILI9341_MADCTL_ROW_COL_EXCHANGE:
+            return (
+                1, bool(panel_madctl & ILI9341_MADCTL_COL_ACCESS_REVERSED))
+        return (0, bool(panel_madctl & ILI9341_MADCTL_ROW_ACCESS_REVERSED))
+
+    def _reset_scroll_state(self):
+        # Scroll area along the scroll axis in framebuffer coordinates, as
+        # [<start>, <end>), and the scroll offset in display lines.
+        self._scroll_area = (0, ILI9341_TFTWIDTH)
+        self._scroll_offset = 0
+
+        # Framebuffer coordinate along the scroll axis -> coordinate to write
+        # to, accounting for the scroll offset. `None` when not scrolled.
+        self._scroll_remap = None
+
+    def _update_scroll_remap(self):
+        if self._scroll_offset == 0:
+            self._scroll_remap = None
+            return
+
+        n = ILI9341_TFTWIDTH
+        _, reversed_ = self._scroll_axis()
+        start, end = self._scroll_area
+
+        # Work with display lines, which are reversed framebuffer coordinates
+        # if the memory access order is reversed.
+        # ---------------------------------------------------------------,
+        lines = np.arange(n)
+        if reversed_:
+            lines = lines[::-1]
+            start, end = n - end, n - start
+
+        in_area = (lines >= start) & (lines < end)
+        lines[in_area] = (
+            start +
+            (lines[in_area] - start + self._scroll_offset) % (end - start))
+
+        if reversed_:
+            lines = (n - 1) - lines
+        # ---------------------------------------------------------------'
+
+        self._scroll_remap = lines
+
+    def set_scroll_area(self, start=0, end=ILI9341_TFTWIDTH):
+        """Define the part of the display which scrolls.
+
+        The scroll area spans from `start` to `end` (exclusive) along the
+        scroll axis, in framebuffer coordinates. The rest of the display stays
+        fixed. In landscape orientations, the scroll axis is the framebuffer
+        width (x axis), and in portrait ones, it is the framebuffer height
+        (y axis). Any current scroll offset is reset.
+
+        """
+        n = ILI9341_TFTWIDTH
+        if not 0 <= start < end <= n:
+            raise ValueError("Invalid scroll area: [{}, {})".format(start, end))
+
+        _, reversed_ = self._scroll_axis()
+        top, bot = (n - end, start) if reversed_ else (start, n - end)
+        vsa = n - top - bot
+
+        with self._update_lock:
+            if self._scroll_offset != 0:
+                # Displayed image is going to jump, repaint everything.
+                self._forget_sent_frame()
+
+            self.send_cmd(bytearray([
+                ILI9341_VSCRDEF,
+                top >> 8, top & 0xFF,
+                vsa >> 8, vsa & 0xFF,
+                bot >> 8, bot & 0xFF]))
+
+            self._scroll_area = (start, end)
+            self._scroll_offset = 0
+            self._send_scroll_start()
+
+    def _send_scroll_start(self):
+        n = ILI9341_TFTWIDTH
+        _, reversed_ = self._scroll_axis()
+        start, end = self._scroll_area
+        top = n - end if reversed_ else start
+        vsp = top + self._scroll_offset
+
+        self.send_cmd(bytearray([ILI9341_VSCRSADD, vsp >> 8, vsp & 0xFF]))
+        self._update_scroll_remap()
+
+    def _hw_scroll(self, n_lines):
+        """Scroll the display contents and the shadow frame by `n_lines`
+        framebuffer coordinates towards the start of the scroll axis."""
+        self._move_scroll_start(n_lines)
+        self._roll_sent_frame(n_lines)
+
+    def _move_scroll_start(self, n_lines):
+        _, reversed_ = self._scroll_axis()
+        start, end = self._scroll_area
+        vsa = end - start
+
+        step = -n_lines if reversed_ else n_lines
+        self._scroll_offset = (self._scroll_offset + step) % vsa
+        self._send_scroll_start()
+
+    def _roll_sent_frame(self, n_lines):
+        axis, _ = self._scroll_axis()
+        start, end = self._scroll_area
+        if self._old_data is not None:
+            area = [slice(None), slice(None)]
+            area[axis] = slice(start, end)
+            area = tuple(area)
+            self._old_data[area] = np.roll(
+                self._old_data[area], -n_lines, axis=axis)
+
+    def scroll(self, n_lines):
+        """Scroll the display contents using the hardware scrolling feature.
+
+        The contents of the scroll area move by `n_lines` towards the start of
+        the scroll axis (negative values move them towards the end). The
+        framebuffer is shifted the same way, so the lines scrolled out wrap
+        around into the exposed lines. Paint the exposed lines and call
+        `update()`, which then only sends those.
 
-            if i == (len(rows) - 1):
-                areas += self._find_updated_cols(top, curr_row, diff)
-            elif curr_row >= (prev_row + self._partial_update_merge_dist):
-                areas += self._find_updated_cols(top, bot, diff)
-                top = bot = curr_row
+        """
+        # Frames queued before the scroll are sent unshifted first.
+        if self._async_thread is not None:
+            self.wait_async()
+
+        with self._update_lock:
+            start, end = self._scroll_area
+            if n_lines % (end - start) == 0:
+                return
+
+            # Tiles with changes not sent yet, which move along.
+            pending = None
+            if self._tile_keys is not None and self._old_digests is not None:
+                pending = self._tile_digests(self._framebuff) != (
+                    self._old_digests)
+
+            axis, _ = self._scroll_axis()
+            area = [slice(None)] * self._framebuff.ndim
+            area[axis] = slice(start, end)
+            area = tuple(area)
+            self._framebuff[area] = np.roll(
+                self._framebuff[area], -n_lines, axis=axis)
+
+            self._hw_scroll(n_lines)
+
+            if pending is not None:
+                self._scroll_tile_digests(pending, n_lines)
+
+    def _scroll_tile_digests(self, pending, n_lines):
+        """Take the tile digests of the framebuffer after scrolling it and the
+        display by `n_lines`, given the tiles which had changes not sent yet
+        before the scroll."""
+        t = self._tile_size
+        axis, _ = self._scroll_axis()
+        start, end = self._scroll_area
+
+        # Scroll the pending changes line by line, and find the tiles they
+        # land on. The display matches the framebuffer everywhere else.
+        # ---------------------------------------------------------------,
+        lines = np.repeat(np.moveaxis(pending, axis, 0), t, axis=0)
+        lines[start:end] = np.roll(lines[start:end], -n_lines, axis=0)
+        pending = lines.reshape(-1, t, lines.shape[1]).any(axis=1)
+        pending = np.moveaxis(pending, 0, axis)
+        # ---------------------------------------------------------------'
+
+        # Flipped digests get the pending tiles resent.
+        digests = self._tile_digests(self._framebuff)
+        digests[pending] = ~digests[pending]
+        self._old_digests = digests
+
+    def _detect_scroll(self, old_data, new_data):
+        """Find a shift along the scroll axis turning the old frame into the
+        new one within the scroll area. Returns zero if there isn't one."""
+        axis, _ = self._scroll_axis()
+        start, end = self._scroll_area
+        old = np.moveaxis(old_data, axis, 0)[start:end]
+        new = np.moveaxis(new_data, axis, 0)[start:end]
+
+        # Compare cheap per-line signatures first.
+        # ---------------------------------------------------------------,
+        weights = np.arange(1, old.shape[1] + 1, dtype=np.uint32)
+        old_sig = old.astype(np.uint32) @ weights
+        new_sig = new.astype(np.uint32) @ weights
+
+        # Scrolling resends all the exposed lines, so it only pays off if
+        # more lines than that have changed.
+        n_changed = np.count_nonzero(old_sig != new_sig)
+        n = end - start
+        max_lines = min(self._scroll_detection_max_lines, n - 1, n_changed - 1)
+        candidates = []
+        for shift in range(-max_lines, max_lines + 1):
+            if shift == 0:
+                continue
+
+            # Content moving by `shift` means new[i] == old[i + shift].
+            if shift > 0:
+                match = new_sig[:(n - shift)] == old_sig[shift:]
+            else:
+                match = new_sig[-shift:] == old_sig[:(n + shift)]
+
+            if match.all():
+                candidates.append(shift)
+        # ---------------------------------------------------------------'
+
+        # Verify exactly, preferring the smallest shift.
+        for shift in sorted(candidates, key=abs):
+            if shift > 0:
+                equal = np.array_equal(new[:(n - shift)], old[shift:])
             else:
-                bot = curr_row
+                equal = np.array_equal(new[-shift:], old[:(n + shift)])
+
+            if equal:
+                return shift
+
+        return 0
+
+    def _find_runs(self, indices, merge_dist):
+        """Group sorted indices into runs.
+
+        A new run is started wherever the gap between two consecutive indices
+        reaches `merge_dist`. Returns the first and the last index of each run
+        as two arrays.
+
+        """
+        merge_dist = max(merge_dist, 2)
+        breaks = np.flatnonzero(np.diff(indices) >= merge_dist)
+        starts = indices[np.concatenate(([0], breaks + 1))]
+        ends = indices[np.concatenate((breaks, [len(indices) - 1]))]
+        return starts, ends
+
+    def _find_dirty_rects(self, mask, merge_dist):
+        """Find rectangles covering all the set pixels of a boolean mask.
 
-            i += 1
+        Rows are grouped into bands first, then columns are grouped within
+        each band. Gaps narrower than `merge_dist` are merged. Returns a list
+        of (x1, y1, x2, y2) tuples, with inclusive coordinates.
 
-        return areas
+        """
+        rows = np.flatnonzero(mask.any(axis=1))
+        if len(rows) == 0:
+            return []
+
+        tops, bots = self._find_runs(rows, merge_dist)
+
+        # Column projection of every band at once. Rows between two bands
+        # are clean, so they do not affect the projections.
+        bands = np.logical_or.reduceat(mask, tops, axis=0)
+
+        # Find column runs of all the bands in one go, breaking the runs
+        # wherever the band changes.
+        # ---------------------------------------------------------------,
+        band_ids, cols = np.nonzero(bands)
+
+        merge_dist = max(merge_dist, 2)
+        breaks = np.flatnonzero(
+            (np.diff(band_ids) != 0) | (np.diff(cols) >= merge_dist))
+        starts = np.concatenate(([0], breaks + 1))
+        ends = np.concatenate((breaks, [len(cols) - 1]))
+        # ---------------------------------------------------------------'
+
+        band_ids = band_ids[starts]
+        return list(zip(
+            cols[starts].tolist(),
+            tops[band_ids].tolist(),
+            cols[ends].tolist(),
+            bots[band_ids].tolist()))
+
+    def _rect_costs(self, x1, y1, x2, y2):
+        """Estimate the bus cost of partial updates, in equivalent bytes.
+
+        Takes arrays of inclusive rectangle coordinates.
+
+        """
+        n_bytes = 2 * (x2 - x1 + 1) * (y2 - y1 + 1)
+
+        s = self._spi_data_chunk_size
+        n_chunks = -(-n_bytes // s) if s > 0 else 1
+
+        return (
+            PARTIAL_UPDATE_SETUP_BYTES + n_bytes +
+            self._transaction_cost_bytes * (
+                PARTIAL_UPDATE_SETUP_TRANSACTIONS + n_chunks))
+
+    def _merge_rects_by_cost(self, rects):
+        """Greedily merge rectangles while it reduces the total bus cost.
+
+        On each step, the pair of rectangles whose bounding box is cheaper
+        than the two of them combined by the largest margin is merged.
+        Rectangles that fall completely inside a merged one are dropped.
+
+        """
+        r = np.array(rects, dtype=np.int64).reshape(-1, 4)
+        while len(r) > 1:
+            x1, y1, x2, y2 = r.T
+            costs = self._rect_costs(x1, y1, x2, y2)
+
+            # Bounding boxes of all the pairs.
+            # ---------------------------------------------------------,
+            bx1 = np.minimum(x1[:, None], x1[None, :])
+            by1 = np.minimum(y1[:, None], y1[None, :])
+            bx2 = np.maximum(x2[:, None], x2[None, :])
+            by2 = np.maximum(y2[:, None], y2[None, :])
+            # ---------------------------------------------------------'
+
+            savings = (
+                costs[:, None] + costs[None, :] -
+                self._rect_costs(bx1, by1, bx2, by2))
+            np.fill_diagonal(savings, np.iinfo(np.int64).min)
+
+            i, j = np.unravel_index(np.argmax(savings), savings.shape)
+            if savings[i, j] <= 0:
+                break
+
+            merged = (bx1[i, j], by1[i, j], bx2[i, j], by2[i, j])
+            inside = (
+                (x1 >= merged[0]) & (y1 >= merged[1]) &
+                (x2 <= merged[2]) & (y2 <= merged[3]))
+            r = np.vstack((r[~inside], merged))
+
+        return [tuple(rect) for rect in r.tolist()]
+
+    def _merge_dirty_rects(self, mask):
+        """Find rectangles covering all the set pixels of a boolean mask,
+        merged according to the configured merging mode."""
+        if self._partial_update_merge_mode == "distance":
+            return self._find_dirty_rects(
+                mask, self._partial_update_merge_dist)
+
+        # Start from exact rectangles. If there are too many of them to
+        # consider pairwise, start from the distance based merge instead.
+        rects = self._find_dirty_rects(mask, 2)
+        if len(rects) > COST_MERGE_MAX_RECTS:
+            rects = self._find_dirty_rects(
+                mask, self._partial_update_merge_dist)
+
+        if 1 < len(rects) <= COST_MERGE_MAX_RECTS:
+            rects = self._merge_rects_by_cost(rects)
+
+        # A single window covering everything may still be the cheapest.
+        if len(rects) > 1:
+            r = np.array(rects, dtype=np.int64)
+            bbox = (
+                r[:, 0].min(), r[:, 1].min(), r[:, 2].max(), r[:, 3].max())
+            if self._rect_costs(*bbox) < self._rect_costs(*r.T).sum():
+                rects = [tuple(int(v) for v in bbox)]
+
+        return rects
+
+    def _tile_digests(self, data):
+        """Return the digests of the tiles of a framebuffer, or of an area of
+        it aligned to the tile grid."""
+        t = self._tile_size
+        kw = self._tile_keys.shape[1]
+
+        # Hash rows as 32-bit words, whether pixels are RGB colors or palette
+        # indices. Only areas of the framebuffer need copying for this.
+        h = data.shape[0]
+        words = np.ascontiguousarray(data).reshape(h, -1).view(np.uint32)
+        z = words.reshape(h // t, t, words.shape[1] // kw, kw) + (
+            self._tile_keys[:, None, :])
+
+        s1, s2, s3 = TILE_HASH_MIX_SHIFTS
+        m1, m2 = TILE_HASH_MIX_MULTIPLIERS
+        z ^= z >> s1
+        z *= m1
+        z ^= z >> s2
+        z *= m2
+        z ^= z >> s3
+        return z.sum(axis=3).sum(axis=1)
+
+    def _tile_area(self, x1, y1, x2, y2):
+        """Return the tiles overlapping an area, and the framebuffer area
+        they cover, as (<rows>, <columns>) slices."""
+        t = self._tile_size
+        tx1, ty1, tx2, ty2 = x1 // t, y1 // t, x2 // t + 1, y2 // t + 1
+        return (
+            (slice(ty1, ty2), slice(tx1, tx2)),
+            (slice(ty1 * t, ty2 * t), slice(tx1 * t, tx2 * t)))
+
+    def _update_tile_digests(self, framebuff, areas):
+        """Take the digests of the tiles overlapping the given areas from the
+        framebuffer they were sent from."""
+        for area in areas:
+            tiles, pixels = self._tile_area(*area)
+            self._old_digests[tiles] = self._tile_digests(framebuff[pixels])
+
+    def _find_changed_tiles(self, framebuff):
+        """Find the changed areas by comparing tile digests, and remember the
+        digests of the new frame."""
+        digests = self._tile_digests(framebuff)
+        old_digests = self._old_digests
+        self._old_digests = digests
+        if old_digests is None:
+            return [(0, 0, self._width - 1, self._height - 1)]
+
+        # Find exact rectangles on the tile grid, and scale them up.
+        t = self._tile_size
+        rects = [
+            (x1 * t, y1 * t, (x2 + 1) * t - 1, (y2 + 1) * t - 1)
+            for x1, y1, x2, y2 in self._find_dirty_rects(
+                digests != old_digests, 2)]
+
+        if self._partial_update_merge_mode == "cost" and len(rects) > 1:
+            rects = self._merge_rects_by_cost(rects)
+
+        return rects
 
     def _find_updated_areas(self, old_data, new_data):
+        if self._tile_keys is not None:
+            return self._find_changed_tiles(new_data)
+
         if self._old_data is None:
             return [(0, 0, self._width - 1, self._height - 1)]
 
-        diff = new_data != old_data
-        return self._find_updated_rows(diff)
+        diff = np.not_equal(new_data, old_data, out=self._diff_mask)
+        return self._merge_dirty_rects(diff)
+
+    def invalidate(self, x, y, w, h):
+        """Declare an area of the framebuffer as changed.
+
+        If any areas are declared before an update, only those are converted
+        and sent, skipping the comparison of the whole frame against the last
+        sent one. The application must then declare every change it makes.
+        Updates without declared areas keep detecting changes by themselves.
+
+        Args:
+
+        - x, y: (int) Top-left corner of the area.
+
+        - w, h: (int) Width and height of the area. The area is clipped to the
+          framebuffer.
+
+        """
+        if w < 0 or h < 0:
+            raise ValueError(
+                "Invalid damage region size: {}x{}".format(w, h))
+
+        x1 = max(x, 0)
+        y1 = max(y, 0)
+        x2 = min(x + w, self._width) - 1
+        y2 = min(y + h, self._height) - 1
+        if x1 <= x2 and y1 <= y2:
+            self._damage.append((x1, y1, x2, y2))
+
+    def _take_damage(self, regions):
+        """Declare the given (x, y, w, h) regions as changed, and return all
+        the declared damage, or `None` if there is none."""
+        if regions is not None:
+            for region in regions:
+                self.invalidate(*region)
+
+        damage = self._damage
+        self._damage = []
+        return damage or None
+
+    def _merge_damage(self, damage):
+        """Merge declared damage rectangles into the areas to send."""
+        if len(damage) <= COST_MERGE_MAX_RECTS:
+            return self._merge_rects_by_cost(damage)
+
+        # Too many to consider pairwise, rasterize them instead.
+        mask = np.zeros((self._height, self._width), dtype=bool)
+        for x1, y1, x2, y2 in damage:
+            mask[y1:(y2 + 1), x1:(x2 + 1)] = True
+        return self._merge_dirty_rects(mask)
+
+    def _check_damage(self, framebuff, areas):
+        if self._tile_keys is not None:
+            # Changes can only be told apart by tile.
+            changed = self._tile_digests(framebuff) != self._old_digests
+            for area in areas:
+                tiles, _ = self._tile_area(*area)
+                changed[tiles] = False
+            changed = np.repeat(
+                np.repeat(changed, self._tile_size, axis=0),
+                self._tile_size, axis=1)
+        else:
+            new_data = self._convert_framebuff(framebuff)
+            changed = new_data != self._old_data
+            for x1, y1, x2, y2 in areas:
+                changed[y1:(y2 + 1), x1:(x2 + 1)] = False
+
+        if changed.any():
+            ys, xs = np.nonzero(changed)
+            raise RuntimeError(
+                "Framebuffer changed outside the declared damage regions,"
+                " within x=[{}, {}], y=[{}, {}]".format(
+                    xs.min(), xs.max(), ys.min(), ys.max()))
+
+    def _add_repaint_areas(self, new_data, areas):
+        """Add the areas showing palette entries whose color changed since
+        they were sent to the areas to send."""
+        mask = np.take(self._stale_indices, new_data)
+        self._stale_indices = None
+        if not mask.any():
+            return areas
+
+        rects = self._merge_dirty_rects(mask)
+        if not areas:
+            return rects
+        return self._merge_damage(list(areas) + rects)
 
     def _update_partial(self, new_data, x1, y1, x2, y2):
-        buff = new_data[
-            y1:(y2 + 1), x1:(x2 + 1)].swapaxes(0, 1).byteswap().tobytes(order='C')
-
-        self.send_cmd(bytearray([
-            ILI9341_PASET, x1 >> 8, x1 & 0xFF, x2 >> 8, x2 & 0xFF]))
-        self.send_cmd(bytearray([
-            ILI9341_CASET, y1 >> 8, y1 & 0xFF, y2 >> 8, y2 & 0xFF]))
-        self.send_cmd(
-            bytearray([ILI9341_RAMWR]) +
-            bytearray(buff))
-
-    def update(self):
-        """Update display."""
-        # Do color conversion to RGB 565 mode in work buffer.
-        # --------------------------------------------------,
-        # Copy data from frame buffer to workbuffer.
-        self._workbuff[:, :, :] = self.framebuff.astype(np.uint16)
-
-        # Prepare red channel.
-        self._workbuff[:, :, 0] >>= 3
-        self._workbuff[:, :, 0] <<= 11
-
-        # Prepare green channel.
-        self._workbuff[:, :, 1] >>= 2
-        self._workbuff[:, :, 1] <<= 5
-
-        # Prepare blue channel.
-        self._workbuff[:, :, 2] >>= 3
-
-        # Merge all three channels in red buffer.
-        self._workbuff[:, :, 0] |= self._workbuff[:, :, 1]
-        self._workbuff[:, :, 0] |= self._workbuff[:, :, 2]
-
-        new_data = self._workbuff[:, :, 0]
-        # --------------------------------------------------'
-
-        updated_areas = self._find_updated_areas(self._old_data, new_data)
-        self._old_data = new_data.copy()
-        for area in updated_areas:
-            self._update_partial(new_data, *area)
+        if self._scroll_remap is None:
+            self._write_window(new_data, x1, y1, x2, y2, x1, y1)
+            return
+
+        # While scrolled, write each part of the area that maps to a
+        # contiguous range of the GRAM separately.
+        # ---------------------------------------------------------------,
+        axis, _ = self._scroll_axis()
+        first, last = (x1, x2) if axis == 1 else (y1, y2)
+
+        dest = self._scroll_remap[first:(last + 1)]
+        breaks = np.flatnonzero(np.diff(dest) != 1)
+        starts = np.concatenate(([0], breaks + 1))
+        ends = np.concatenate((breaks, [len(dest) - 1]))
+        for a, b in zip(starts.tolist(), ends.tolist()):
+            if axis == 1:
+                self._write_window(
+                    new_data, x1 + a, y1, x1 + b, y2, int(dest[a]), y1)
+            else:
+                self._write_window(
+                    new_data, x1, y1 + a, x2, y1 + b, x1, int(dest[a]))
+        # ---------------------------------------------------------------'
+
+    def _write_window(self, new_data, x1, y1, x2, y2, dest_x1, dest_y1):
+        """Write an area of the frame to the display, placing its top-left
+        corner at (`dest_x1`, `dest_y1`).
+
+        The display memory is filled in framebuffer memory order, so areas
+        spanning the full frame width are sent without copying.
+
+        """
+        pixels = new_data[y1:(y2 + 1), x1:(x2 + 1)]
+        if self._palette_wire is not None:
+            # Expand palette indices, which also makes the pixels contiguous.
+            pixels = self._palette_wire[pixels]
+        elif pixels.ndim == 3:
+            # RGB colors straight from the framebuffer, with "tile_hash"
+            # change detection.
+            wire = np.empty(pixels.shape[:2], dtype=np.uint16)
+            _convert_to_wire(pixels, wire, np.empty_like(wire))
+            pixels = wire
+        else:
+            pixels = np.ascontiguousarray(pixels)
+
+        self._send_window(pixels, dest_x1, dest_y1)
+
+    def _send_window(self, pixels, x1, y1):
+        """Send contiguous wire order RGB565 pixels to the display, placing
+        their top-left corner at (`x1`, `y1`)."""
+        h, w = pixels.shape
+        self._set_addr_range(ILI9341_CASET, x1, x1 + w - 1)
+        self._set_addr_range(ILI9341_PASET, y1, y1 + h - 1)
+        self.send_cmd(bytearray([ILI9341_RAMWR]), data=pixels)
+
+    def _make_sprite(self, image):
+        """Convert an image to a sprite, holding its wire order pixels."""
+        pixels = np.array(image, dtype=np.uint8)
+        if pixels.shape[2:] != self._buffer_shape[2:] or pixels.ndim < 2:
+            raise ValueError(
+                "Image must be a {} array!".format(
+                    "(<height>, <width>) palette index"
+                    if self._palette is not None else
+                    "(<height>, <width>, <rgb-color>)"))
+
+        if self._palette is not None:
+            wire = self._palette_wire[pixels]
+        else:
+            wire = np.empty(pixels.shape[:2], dtype=np.uint16)
+            _convert_to_wire(pixels, wire, np.empty_like(wire))
+
+        return Ili9341Sprite(pixels, wire)
+
+    def blit(self, image, x, y, key=None):
+        """Draw an image on the framebuffer, and send it to the display right
+        away.
+
+        The image is converted to RGB565 once, and kept in the sprite cache,
+        so drawing the same image again sends the cached pixels as is. The
+        framebuffer and the last sent frame are kept up to date, so the next
+        update doesn't resend the image.
+
+        Args:
+
+        - image: (numpy.ndarray) The (<height>, <width>, <rgb-color>) image
+          to draw, or a (<height>, <width>) array of palette indices in
+          indexed color mode. May be `None` if `key` is given and cached.
+
+        - x, y: (int) Position of the top-left corner of the image. The image
+          is clipped to the framebuffer.
+
+        - key: (hashable) Identifies the image in the sprite cache. If
+          `None`, the image is identified by a hash of its contents.
+
+        Returns the key of the image in the cache.
+
+        """
+        if key is None:
+            if image is None:
+                raise ValueError("Either an image or a key must be given!")
+            key = content_key(image)
+
+        sprite = self._sprite_cache.get(key)
+        if sprite is None:
+            if image is None:
+                raise ValueError("No image cached as {!r}!".format(key))
+            sprite = self._make_sprite(image)
+            self._sprite_cache.put(key, sprite)
+
+        # Clip the image to the framebuffer.
+        # ---------------------------------------------------------------,
+        h, w = sprite.shape
+        x1 = max(x, 0)
+        y1 = max(y, 0)
+        x2 = min(x + w, self._width) - 1
+        y2 = min(y + h, self._height) - 1
+        if x1 > x2 or y1 > y2:
+            return key
+
+        src = (slice(y1 - y, y2 - y + 1), slice(x1 - x, x2 - x + 1))
+        dst = (slice(y1, y2 + 1), slice(x1, x2 + 1))
+        # ---------------------------------------------------------------'
+
+        # Queued frames don't have the image yet.
+        if self._async_thread is not None:
+            self.wait_async()
+
+        with self._update_lock:
+            # Without a last sent frame, the next update repaints everything
+            # anyway.
+            if not self._has_sent_frame():
+                self._framebuff[dst] = sprite.pixels[src]
+                return key
+
+            if self._tile_keys is not None:
+                # The display only matches the framebuffer in the tiles
+                # without changes waiting for the next update.
+                tiles, pixels = self._tile_area(x1, y1, x2, y2)
+                pending = self._tile_digests(self._framebuff[pixels]) != (
+                    self._old_digests[tiles])
+
+                self._framebuff[dst] = sprite.pixels[src]
+
+                # Flipped digests get the pending tiles resent.
+                digests = self._tile_digests(self._framebuff[pixels])
+                digests[pending] = ~digests[pending]
+                self._old_digests[tiles] = digests
+                sent_data = self._framebuff
+            else:
+                self._framebuff[dst] = sprite.pixels[src]
+
+                if self._palette is not None:
+                    self._old_data[dst] = sprite.pixels[src]
+                else:
+                    self._old_data[dst] = sprite.wire[src]
+                sent_data = self._old_data
+
+            with self._bus_batch():
+                if self._scroll_remap is None:
+                    self._send_window(
+                        np.ascontiguousarray(sprite.wire[src]), x1, y1)
+                else:
+                    self._update_partial(sent_data, x1, y1, x2, y2)
+
+        return key
+
+    def _convert_framebuff(self, framebuff):
+        """Convert a framebuffer to RGB565 and return the result.
+
+        The result holds pixel values in wire (big-endian) byte order, so it
+        can be sent to the display as is.
+
+        """
+        # Convert into the buffer which is not holding the last sent frame.
+        new_data = self._rgb565_buffs[0]
+        if new_data is self._old_data:
+            new_data = self._rgb565_buffs[1]
+
+        if self._palette is not None:
+            # Palette indices are only expanded when sent.
+            np.copyto(new_data, framebuff)
+            return new_data
+
+        _convert_to_wire(framebuff, new_data, self._rgb565_scratch)
+        return new_data
+
+    def _convert_area(self, framebuff, x1, y1, x2, y2):
+        """Convert an area of a framebuffer to RGB565, in place of the last
+        sent frame."""
+        area = (slice(y1, y2 + 1), slice(x1, x2 + 1))
+        if self._palette is not None:
+            self._old_data[area] = framebuff[area]
+            return
+
+        _convert_to_wire(
+            framebuff[area], self._old_data[area], self._rgb565_scratch[area])
+
+    def _update_from(self, framebuff, damage=None):
+        """Update display with the contents of the given framebuffer.
+
+        If `damage` is given, only those areas are assumed to have changed
+        since the last update.
+
+        """
+        with self._update_lock:
+            self._send_update(self._prepare_update(framebuff, damage))
+
+    def _prepare_update(self, framebuff, damage=None):
+        """Find and convert the areas of a framebuffer to send, without using
+        the bus, so that it can be done while another display sharing the bus
+        transmits.
+
+        Returns the update to pass to `_send_update()`, which must be done
+        before preparing the next one: the display state already assumes it
+        is sent.
+
+        """
+        with self._update_lock:
+            stime = time.perf_counter()
+            n_scroll_lines = 0
+
+            if damage is not None and self._has_sent_frame():
+                # Convert the damaged areas in place, no diff needed.
+                # ----------------------------------------------------,
+                updated_areas = self._merge_damage(damage)
+                if self._validate_damage:
+                    self._check_damage(framebuff, updated_areas)
+
+                if self._tile_keys is not None:
+                    # Areas are converted as they are sent.
+                    self._update_tile_digests(framebuff, updated_areas)
+                    new_data = framebuff
+                    diff_etime = time.perf_counter()
+                else:
+                    diff_etime = time.perf_counter()
+                    for area in updated_areas:
+                        self._convert_area(framebuff, *area)
+                    new_data = self._old_data
+
+                convert_time = time.perf_counter() - diff_etime
+                diff_time = diff_etime - stime
+                # ----------------------------------------------------'
+            elif self._tile_keys is not None:
+                # Tiles are compared on the framebuffer itself, and only the
+                # changed ones are converted, as they are sent.
+                new_data = framebuff
+                updated_areas = self._find_updated_areas(None, new_data)
+
+                convert_time = 0.0
+                diff_time = time.perf_counter() - stime
+            else:
+                new_data = self._convert_framebuff(framebuff)
+                convert_etime = time.perf_counter()
+
+                if self._scroll_detection and self._old_data is not None:
+                    n_scroll_lines = self._detect_scroll(
+                        self._old_data, new_data)
+                    if n_scroll_lines != 0:
+                        # The scroll start is only sent with the update.
+                        self._roll_sent_frame(n_scroll_lines)
+
+                updated_areas = self._find_updated_areas(
+                    self._old_data, new_data)
+                self._old_data = new_data
+
+                convert_time = convert_etime - stime
+                diff_time = time.perf_counter() - convert_etime
+
+            if self._stale_indices is not None:
+                updated_areas = self._add_repaint_areas(
+                    new_data, updated_areas)
+
+            prepare_time = time.perf_counter() - stime
+
+        return (
+            new_data, updated_areas, n_scroll_lines,
+            convert_time, diff_time, prepare_time)
+
+    def _send_update(self, update):
+        """Send an update returned by `_prepare_update()`."""
+        (new_data, updated_areas, n_scroll_lines,
+            convert_time, diff_time, prepare_time) = update
+
+        with self._update_lock:
+            stime = time.perf_counter()
+            bus_totals = (
+                self._n_bus_bytes,
+                self._n_bus_transactions,
+                self._n_dc_toggles)
+
+            with self._bus_batch():
+                if n_scroll_lines != 0:
+                    self._move_scroll_start(n_scroll_lines)
+
+                for area in updated_areas:
+                    self._update_partial(new_data, *area)
+
+            # Batched writes are only flushed at this point.
+            etime = time.perf_counter()
+            transmit_time = etime - stime
+            update_time = prepare_time + transmit_time
+
+            if self._autotuner is not None and updated_areas:
+                self._autotuner.record(update_time)
+
+            if self._stats is not None:
+                self._record_stats(
+                    updated_areas, bus_totals, convert_time, diff_time,
+                    transmit_time, update_time, etime)
+
+    def _record_stats(
+            self, updated_areas, bus_totals, convert_time, diff_time,
+            transmit_time, update_time, etime):
+        sample = {
+            "convert_time": convert_time,
+            "diff_time": diff_time,
+            "transmit_time": transmit_time,
+            "update_time": update_time,
+            "n_regions": len(updated_areas),
+            "n_pixels": sum(
+                (x2 - x1 + 1) * (y2 - y1 + 1)
+                for x1, y1, x2, y2 in updated_areas),
+            "n_bytes": self._n_bus_bytes - bus_totals[0],
+            "n_transactions": self._n_bus_transactions - bus_totals[1],
+            "n_dc_toggles": self._n_dc_toggles - bus_totals[2],
+        }
+        self._stats.record(sample, etime)
+
+        if self._stats_callback is not None:
+            self._stats_callback(sample)
+
+    def update(self, regions=None):
+        """Update display.
+
+        Any frames queued with `update_async()` are sent first.
+
+        Args:
+
+        - regions: (list) Optional (x, y, w, h) areas of the framebuffer which
+          changed, in addition to those declared with `invalidate()`. If there
+          are any, only they are sent. Otherwise, changes are detected by
+          comparing the whole frame.
+
+        """
+        if self._async_thread is not None:
+            self.wait_async()
+
+        self._update_from(self._framebuff, self._take_damage(regions))
+
+    def update_async(self, policy=None, regions=None):
+        """Update display in a background thread.
+
+        A snapshot of the framebuffer is taken and the call returns
+        immediately, so the next frame can be rendered while this one is being
+        converted and sent. At most one frame is sent while another one waits;
+        a newer frame is handled according to the async update policy.
+
+        Args:
+
+        - policy: (str) Overrides the async update policy for this call, if
+          not `None`.
+
+        - regions: (list) Optional (x, y, w, h) areas of the framebuffer which
+          changed. See `update()`.
+
+        Returns a `concurrent.futures.Future`, resolving to `True` once the
+        frame is sent or to `False` if it was dropped in favour of a newer
+        frame.
+
+        """
+        if policy is None:
+            policy = self._async_update_policy
+        elif policy not in ASYNC_UPDATE_POLICIES:
+            raise ValueError(
+                "Async update policy must be one of: {}".format(
+                    ", ".join(ASYNC_UPDATE_POLICIES)))
+
+        future = concurrent.futures.Future()
+        damage = self._take_damage(regions)
+
+        with self._async_cond:
+            if self._async_thread is None:
+                self._async_stopping = False
+                self._async_thread = threading.Thread(
+                    target=self._async_update_loop,
+                    name="Ili9341AsyncUpdate",
+                    daemon=True)
+                self._async_thread.start()
+
+            if policy == "block":
+                while self._async_pending is not None:
+                    self._async_cond.wait()
+
+            if self._async_pending is not None:
+                # Drop the stale pending frame, reusing its buffer. Its
+                # damage is carried over to the new frame.
+                buff, stale_future, stale_damage = self._async_pending
+                if stale_future.set_running_or_notify_cancel():
+                    stale_future.set_result(False)
+
+                if stale_damage is None or damage is None:
+                    damage = None
+                else:
+                    damage = stale_damage + damage
+            elif self._async_spare_buffs:
+                buff = self._async_spare_buffs.pop()
+            else:
+                buff = np.empty_like(self._framebuff)
+
+            np.copyto(buff, self._framebuff)
+            self._async_pending = (buff, future, damage)
+            self._async_cond.notify_all()
+
+        return future
+
+    def wait_async(self, timeout=None):
+        """Wait until all the frames queued with `update_async()` are sent.
+
+        Returns `False` if the timeout expired, `True` otherwise.
+
+        """
+        with self._async_cond:
+            return self._async_cond.wait_for(
+                lambda: (
+                    self._async_pending is None and
+                    self._async_running is None),
+                timeout)
+
+    def stop_async(self):
+        """Send the queued frames and stop the background update thread."""
+        with self._async_cond:
+            thread = self._async_thread
+            if thread is None:
+                return
+
+            self._async_stopping = True
+            self._async_cond.notify_all()
+
+        thread.join()
+
+        with self._async_cond:
+            self._async_thread = None
+
+    def _async_update_loop(self):
+        while True:
+            with self._async_cond:
+                while self._async_pending is None:
+                    if self._async_stopping:
+                        return
+                    self._async_cond.wait()
+
+                buff, future, damage = self._async_pending
+                self._async_pending = None
+                self._async_running = future
+                self._async_cond.notify_all()
+
+            if future.set_running_or_notify_cancel():
+                try:
+                    self._update_from(buff, damage)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(True)
+
+            with self._async_cond:
+                self._async_running = None
+                self._async_spare_buffs.append(buff)
+                self._async_cond.notify_all()
 
     def clear(self, color=(0, 0, 0)):
-        """Clear display with a specific color."""
-        self.framebuff[:, :, :] = color
+        """Clear display with a specific color.
+
+        In indexed color mode, `color` is either a palette index or a color
+        of the palette.
+
+        """
+        if self._palette is not None and not np.isscalar(color):
+            matches = np.flatnonzero((self._palette == color).all(axis=1))
+            if len(matches) == 0:
+                raise ValueError(
+                    "Color {} is not in the palette!".format(tuple(color)))
+            color = matches[0]
+
+        self.framebuff[...] = color
         self.update()
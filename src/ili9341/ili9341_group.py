@@ -0,0 +1,354 @@
+"""This module implements a scheduler for several ILI9341 displays sharing one
+SPI bus.
+
+Displays on the same spidev bus or FTDI chip, each with its own chip select,
+can only be written one at a time. The group owns the bus and sends the
+pending frames of its displays one after another from a single background
+thread, so the bus never idles while a frame is waiting and no display
+starves. While a frame is sent, the next one is converted and compared
+against what its display shows on a helper thread, so that work doesn't idle
+the bus either.
+
+"""
+
+import time
+import threading
+import collections
+import concurrent.futures
+
+import numpy as np
+
+
+# Number of recent frames to compute the framerate of each display from.
+GROUP_FPS_WINDOW = 30
+
+
+class _GroupMember(object):
+    """Scheduling state of a display in a group."""
+
+    def __init__(self, lcd, priority):
+        self.lcd = lcd
+        self.priority = priority
+
+        # (<framebuffer-snapshot>, <future>, <damage>) waiting to be sent.
+        self.pending = None
+        self.spare_buffs = []
+
+        # Whether a frame taken from `pending` is being prepared or sent.
+        self.running = False
+
+        # Time spent sending so far, scaled by the inverse of the priority.
+        self.vtime = 0.0
+
+        self.n_frames = 0
+        self.n_dropped = 0
+        self.bus_time = 0.0
+        self.frame_times = collections.deque(maxlen=GROUP_FPS_WINDOW)
+
+
+class Ili9341Group(object):
+    """Class to drive several `Ili9341Base` displays sharing one SPI bus.
+
+    Frames are submitted per display with `submit()`, and are sent by a
+    background thread. Whenever several displays have a frame waiting, the one
+    which used the least bus time relative to its priority goes first. With
+    equal priorities, this shares the bus fairly.
+
+    The displays must not be updated directly while they are in a group.
+
+    """
+
+    def __init__(self, displays, priorities=None):
+        """Initialize Ili9341Group class.
+
+        Args:
+
+        - displays: (list) The `Ili9341Base` displays sharing the bus.
+
+        - priorities: (list) Positive weight of each display. A display gets a
+          share of the bus time proportional to its weight, whenever several
+          displays have frames waiting. If `None`, all displays are weighted
+          equally.
+
+        """
+        if priorities is None:
+            priorities = [1.0] * len(displays)
+
+        if len(priorities) != len(displays):
+            raise ValueError("There must be a priority for each display!")
+
+        if any(p <= 0 for p in priorities):
+            raise ValueError("Priorities must be positive!")
+
+        self._members = [
+            _GroupMember(lcd, float(p))
+            for lcd, p in zip(displays, priorities)]
+
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._n_running = 0
+        self._last_member = None
+
+        self._start_time = time.perf_counter()
+        self._busy_time = 0.0
+
+        self._prepare_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="Ili9341GroupPrepare")
+
+        self._thread = threading.Thread(
+            target=self._schedule_loop,
+            name="Ili9341GroupScheduler",
+            daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def displays(self):
+        """The displays of the group, in order."""
+        return [m.lcd for m in self._members]
+
+    @property
+    def bus_utilization(self):
+        """Fraction of the time since the group was created, or since the
+        last `reset_stats()`, spent sending frames."""
+        elapsed = time.perf_counter() - self._start_time
+        return self._busy_time / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        """Return a list of per-display statistics, in display order.
+
+        Each item is a dictionary with the number of frames sent, the number
+        of frames dropped in favour of newer ones, the time spent sending
+        them in seconds, and the framerate over the last few frames.
+        Converting and diffing frames is not counted, as it overlaps with
+        sending the frames of other displays.
+
+        """
+        result = []
+        with self._cond:
+            for m in self._members:
+                t = m.frame_times
+                fps = 0.0
+                if len(t) > 1 and t[-1] > t[0]:
+                    fps = (len(t) - 1) / (t[-1] - t[0])
+
+                result.append({
+                    "frames": m.n_frames,
+                    "dropped": m.n_dropped,
+                    "bus_time": m.bus_time,
+                    "fps": fps,
+                })
+
+        return result
+
+    def reset_stats(self):
+        """Reset the statistics of all displays."""
+        with self._cond:
+            self._start_time = time.perf_counter()
+            self._busy_time = 0.0
+            for m in self._members:
+                m.n_frames = 0
+                m.n_dropped = 0
+                m.bus_time = 0.0
+                m.frame_times.clear()
+
+    def submit(self, index, regions=None):
+        """Queue the current framebuffer of a display to be sent.
+
+        A snapshot of the framebuffer is taken, so the next frame can be
+        rendered right away. If the display already has a frame waiting, that
+        frame is dropped in favour of this one.
+
+        Args:
+
+        - index: (int) Index of the display in the group.
+
+        - regions: (list) Optional (x, y, w, h) areas of the framebuffer which
+          changed. See `Ili9341Base.update()`.
+
+        Returns a `concurrent.futures.Future`, resolving to `True` once the
+        frame is sent or to `False` if it was dropped.
+
+        """
+        m = self._members[index]
+        future = concurrent.futures.Future()
+        damage = m.lcd._take_damage(regions)
+
+        with self._cond:
+            if self._stopping:
+                raise RuntimeError("Display group is closed!")
+
+            if m.pending is not None:
+                buff, stale_future, stale_damage = m.pending
+                if stale_future.set_running_or_notify_cancel():
+                    stale_future.set_result(False)
+                m.n_dropped += 1
+
+                if stale_damage is None or damage is None:
+                    damage = None
+                else:
+                    damage = stale_damage + damage
+            else:
+                if self._is_idle(m):
+                    # Don't let a display bank bus time while idle.
+                    m.vtime = max(m.vtime, self._min_vtime())
+
+                if m.spare_buffs:
+                    buff = m.spare_buffs.pop()
+                else:
+                    buff = np.empty_like(m.lcd.framebuff)
+
+            np.copyto(buff, m.lcd.framebuff)
+            m.pending = (buff, future, damage)
+            self._cond.notify_all()
+
+        return future
+
+    def update(self, regions=None):
+        """Send the current framebuffers of all displays, and wait until they
+        are sent.
+
+        Args:
+
+        - regions: (list) Optional list with the changed areas of each
+          display, or `None` for a display to detect them by itself. See
+          `Ili9341Base.update()`.
+
+        """
+        if regions is None:
+            regions = [None] * len(self._members)
+
+        futures = [
+            self.submit(i, r) for i, r in enumerate(regions)]
+        for f in futures:
+            f.result()
+
+    def wait(self, timeout=None):
+        """Wait until all the submitted frames are sent.
+
+        Returns `False` if the timeout expired, `True` otherwise.
+
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: (
+                    self._n_running == 0 and
+                    all(m.pending is None for m in self._members)),
+                timeout)
+
+    def close(self):
+        """Send the remaining frames and stop the scheduler thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+        self._thread.join()
+        self._prepare_pool.shutdown()
+
+    def _is_idle(self, member):
+        return (
+            member.pending is None and not member.running and
+            member is not self._last_member)
+
+    def _min_vtime(self):
+        busy = [
+            m.vtime for m in self._members
+            if m.pending is not None or m.running or
+            m is self._last_member]
+        return min(busy) if busy else 0.0
+
+    def _next_member(self, exclude=None):
+        waiting = [
+            m for m in self._members
+            if m.pending is not None and m is not exclude]
+        if not waiting:
+            return None
+
+        return min(waiting, key=lambda m: m.vtime)
+
+    def _start_frame(self, m):
+        """Take the pending frame of a display, and start preparing it on the
+        helper thread. Called with the lock held."""
+        buff, future, damage = m.pending
+        m.pending = None
+        m.running = True
+        self._n_running += 1
+
+        prepared = self._prepare_pool.submit(
+            self._prepare_frame, m, future, buff, damage)
+        return (m, buff, future, prepared)
+
+    def _prepare_frame(self, m, future, buff, damage):
+        """Returns the update to send, or `None` if the frame was cancelled or
+        failed."""
+        if not future.set_running_or_notify_cancel():
+            return None
+
+        try:
+            return m.lcd._prepare_update(buff, damage)
+        except BaseException as e:
+            future.set_exception(e)
+            return None
+
+    def _schedule_loop(self):
+        # (<member>, <framebuffer-snapshot>, <future>, <prepare-future>) of
+        # the frame to send next.
+        frame = None
+
+        while True:
+            if frame is None:
+                with self._cond:
+                    m = self._next_member()
+                    while m is None:
+                        if self._stopping:
+                            return
+                        self._cond.wait()
+                        m = self._next_member()
+
+                    frame = self._start_frame(m)
+
+            m, buff, future, prepared = frame
+            update = prepared.result()
+
+            # Prepare the frame of another display while this one is sent.
+            with self._cond:
+                n = self._next_member(exclude=m)
+                frame = self._start_frame(n) if n is not None else None
+
+            sent = False
+            elapsed = 0.0
+            if update is not None:
+                if m is not self._last_member:
+                    # Displays may share the DC/X line, so its level is
+                    # unknown after writing to another display.
+                    m.lcd._dcx_mode = None
+                self._last_member = m
+
+                stime = time.perf_counter()
+                try:
+                    m.lcd._send_update(update)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(True)
+                    sent = True
+                etime = time.perf_counter()
+                elapsed = etime - stime
+
+            with self._cond:
+                m.vtime += elapsed / m.priority
+                m.bus_time += elapsed
+                self._busy_time += elapsed
+                if sent:
+                    m.n_frames += 1
+                    m.frame_times.append(etime)
+
+                m.spare_buffs.append(buff)
+                m.running = False
+                self._n_running -= 1
+                self._cond.notify_all()
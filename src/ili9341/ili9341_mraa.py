@@ -12,6 +12,11 @@ from .ili9341_base import Ili9341Base
 class Ili9341Mraa(Ili9341Base):
     """Class to manipulate ILI9341 SPI displays using eclipse/mraa library."""
 
+    # Each transaction copies the buffer and goes through the SWIG bindings
+    # into libmraa, and each DC/X change is a sysfs GPIO file write on most
+    # boards.
+    DEFAULT_TRANSACTION_COST_BYTES = 128
+
     def __init__(
             self,
             spi_id,
@@ -54,10 +59,11 @@ class Ili9341Mraa(Ili9341Base):
         else:
             self._rst_pin = None
 
-        super().__init__(**kwargs)
+        super().__init__(spi_clock_hz=spi_clock_hz, **kwargs)
 
     def _spi_write(self, buff):
-        self._spi.write(buff)
+        # Mraa only accepts bytearrays, so buffer views have to be copied.
+        self._spi.write(bytearray(buff))
 
     def _switch_to_ctrl_mode(self):
         self._dcx_pin.write(0)
@@ -5,74 +5,190 @@ display, using FTxxx family USB-to-GPIO breakout boards.
 
 import re
 import time
+import struct
+import weakref
 import pyftdi.spi
+from pyftdi.ftdi import Ftdi
 
 from .ili9341_base import Ili9341Base
 
 
+# Maximum number of bytes to send with a single MPSSE write command.
+MPSSE_WRITE_MAX_LENGTH = pyftdi.spi.SpiController.PAYLOAD_MAX_LENGTH
+
+# GPIO output levels of each SPI controller, shared by all the displays using
+# it. Writes replace the whole GPIO port, so each display must preserve the
+# pins of the others.
+_CONTROLLER_GPIO_LEVELS = weakref.WeakKeyDictionary()
+
+# GPIO pins used by all the displays of each SPI controller. pyftdi only
+# writes the pins of the last direction change, so it must cover all of them.
+_CONTROLLER_GPIO_MASKS = weakref.WeakKeyDictionary()
+
+
 class Ili9341Pyftdi(Ili9341Base):
     """Class to manipulate ILI9341 SPI displays using FTxxxx (FT232h etc.)
     family USB-to-GPIO breakout boards.
 
     """
 
+    # Each transaction or GPIO write is a USB round trip of about a millisecond.
+    DEFAULT_TRANSACTION_COST_BYTES = 4096
+
+    # pyftdi refuses transactions larger than its maximum payload length.
+    AUTOTUNE_CHUNK_SIZES = (
+        1024, 4096, 16384, pyftdi.spi.SpiController.PAYLOAD_MAX_LENGTH)
+
     def __init__(
             self,
             pyftdi_interface_path,
             dcx_pin_id,
             rst_pin_id=None,
             spi_clock_hz=42_000_000,
+            mpsse_batching=False,
+            spi_controller=None,
+            cs=0,
             **kwargs):
         """Initialize Ili9341Pyftdi class.
 
         Args:
         - pyftdi_interface_path: (str) A path describing FTDI io interface.
-          E.g.: 'ftdi://ftdi:232h/1'
+          E.g.: 'ftdi://ftdi:232h/1'. Ignored if `spi_controller` is given.
         - dcx_pin_id: (int) GPIO pin where display DC/X pin is connected. For
           example, if DC/X is connected to `D4` pin of FT232H board, pin id will
           be `4`.
         - rst_pin_id: (int) GPIO pin where display RST pin is connected. Can be
           set to `None` if hardware reset is not used (pin is connected to +3.3V).
         - spi_clock_hz: (int) Desired SPI clock frequency, in Hz.
+        - mpsse_batching: (bool) If enabled, SPI writes and DC/X level changes
+          are encoded into a single MPSSE command stream, which is sent to the
+          FTDI chip in as few USB transfers as possible at the end of each
+          command or update. Both DC/X and RST pins must be on the lower GPIO
+          byte (D4 - D7) for this.
+        - spi_controller: (pyftdi.spi.SpiController) An already configured
+          controller to share with other displays on the same FTDI chip, each
+          using its own chip select. See `Ili9341Group` class. If `None`, a
+          controller is created from `pyftdi_interface_path`.
+        - cs: (int) Chip select line of the display on the controller. `0`
+          for D3, `1` for D4 and so on.
         - Extra keyword arguments are forwarded to `Ili9341Base` class.
 
         """
         # Create SPI device.
-        self._spi_controller = pyftdi.spi.SpiController(cs_count=1)
-        self._spi_controller.configure(pyftdi_interface_path)
+        if spi_controller is None:
+            spi_controller = pyftdi.spi.SpiController(cs_count=1)
+            spi_controller.configure(pyftdi_interface_path)
 
+        self._spi_controller = spi_controller
         self._spi = self._spi_controller.get_port(
-            cs=0, freq=spi_clock_hz, mode=0)
+            cs=cs, freq=spi_clock_hz, mode=0)
 
         # Configure GPIO.
         self._dcx_pin_id = dcx_pin_id
         self._rst_pin_id = rst_pin_id
 
+        # Keep the RST pin high while toggling the DC/X pin.
+        self._rst_bits = (
+            1 << self._rst_pin_id if self._rst_pin_id is not None else 0)
+        self._pin_mask = (1 << self._dcx_pin_id) | self._rst_bits
+
+        gpio_mask = _CONTROLLER_GPIO_MASKS.setdefault(self._spi_controller, [0])
+        gpio_mask[0] |= self._pin_mask
+
         self._gpio = self._spi_controller.get_gpio()
-        if self._rst_pin_id is not None:
-            self._gpio.set_direction(
-                (1 << self._dcx_pin_id) | (1 << self._rst_pin_id),
-                (1 << self._dcx_pin_id) | (1 << self._rst_pin_id))
+        self._gpio.set_direction(gpio_mask[0], gpio_mask[0])
+
+        self._gpio_levels = _CONTROLLER_GPIO_LEVELS.setdefault(
+            self._spi_controller, [0])
+        self._gpio_levels[0] |= self._rst_bits
+
+        # Setup MPSSE command batching.
+        # ---------------------------------------------------------------,
+        self._mpsse_batching = mpsse_batching
+        if self._mpsse_batching:
+            if self._dcx_pin_id > 7 or (
+                    self._rst_pin_id is not None and self._rst_pin_id > 7):
+                raise ValueError(
+                    "MPSSE batching requires DC/X and RST pins to be on the"
+                    " lower GPIO byte!")
+
+            # Regular SPI transactions set the clock lazily; we never use them.
+            # Clamp as the SPI port does, FT232H tops out at 30MHz.
+            self._spi_controller.ftdi.set_frequency(
+                min(spi_clock_hz, self._spi_controller.frequency_max))
+
+        self._mpsse_cmds = bytearray()
+        self._mpsse_cs_bit = pyftdi.spi.SpiController.CS_BIT << cs
+        self._mpsse_all_cs_bits = (
+            pyftdi.spi.SpiController.CS_BIT *
+            ((1 << self._spi_controller.channels) - 1))
+        self._mpsse_selected = False
+        # ---------------------------------------------------------------'
+
+        super().__init__(spi_clock_hz=spi_clock_hz, **kwargs)
+
+    def _write_pins(self, bits):
+        """Set the levels of the DC/X and RST pins, preserving the other GPIO
+        pins of a shared controller."""
+        levels = self._gpio_levels
+        levels[0] = (levels[0] & ~self._pin_mask) | bits
+
+        if self._mpsse_batching:
+            self._mpsse_set_pins(True)
         else:
-            self._gpio.set_direction(
-                1 << self._dcx_pin_id, 1 << self._dcx_pin_id)
+            self._gpio.write(levels[0])
+
+    def _mpsse_set_pins(self, selected):
+        """Queue an MPSSE command setting the GPIO and chip select levels."""
+        cs_bits = self._mpsse_all_cs_bits
+        if selected:
+            cs_bits &= ~self._mpsse_cs_bit
 
-        super().__init__(**kwargs)
+        self._mpsse_cmds += bytes((
+            Ftdi.SET_BITS_LOW,
+            (self._gpio_levels[0] & 0xFF) | cs_bits,
+            self._spi_controller.direction & 0xFF))
+        self._mpsse_selected = selected
 
     def _spi_write(self, buff):
-        self._spi.write(buff)
+        if not self._mpsse_batching:
+            self._spi.write(buff)
+            return
+
+        if not self._mpsse_selected:
+            self._mpsse_set_pins(True)
+
+        # SPI mode 0: data is written on the falling clock edge, MSB first.
+        buff = memoryview(buff)
+        for i in range(0, len(buff), MPSSE_WRITE_MAX_LENGTH):
+            chunk = buff[i:(i + MPSSE_WRITE_MAX_LENGTH)]
+            self._mpsse_cmds += struct.pack(
+                "<BH", Ftdi.WRITE_BYTES_NVE_MSB, len(chunk) - 1)
+            self._mpsse_cmds += chunk
 
     def _switch_to_ctrl_mode(self):
-        self._gpio.write(0 << self._dcx_pin_id)
+        self._write_pins(self._rst_bits | (0 << self._dcx_pin_id))
 
     def _switch_to_data_mode(self):
-        self._gpio.write(1 << self._dcx_pin_id)
+        self._write_pins(self._rst_bits | (1 << self._dcx_pin_id))
+
+    def _flush_bus(self):
+        if not self._mpsse_cmds:
+            return
+
+        # Release chip select and have the FTDI chip flush its buffers.
+        self._mpsse_set_pins(False)
+        self._mpsse_cmds.append(Ftdi.SEND_IMMEDIATE)
+
+        self._spi_controller.ftdi.write_data(self._mpsse_cmds)
+        self._mpsse_cmds = bytearray()
 
     def _do_hardware_reset(self):
         if self._rst_pin_id is not None:
-            self._gpio.write(1 << self._rst_pin_id)
-            time.sleep(0.005)
-            self._gpio.write(0 << self._rst_pin_id)
-            time.sleep(0.02)
-            self._gpio.write(1 << self._rst_pin_id)
-            time.sleep(0.150)
+            levels = self._gpio_levels
+            for level, delay in ((1, 0.005), (0, 0.02), (1, 0.150)):
+                levels[0] = (
+                    (levels[0] & ~self._pin_mask) |
+                    (level << self._rst_pin_id))
+                self._gpio.write(levels[0])
+                time.sleep(delay)
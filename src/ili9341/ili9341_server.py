@@ -0,0 +1,348 @@
+"""This module implements a display server, letting several processes draw on
+one ILI9341 display.
+
+The server owns the display, and places its framebuffer in shared memory.
+Clients map the same memory and write pixels in place, so frames are never
+copied between processes. They then ask the server to present the changed
+regions over a `multiprocessing.connection` channel. The server is the only
+one writing to the bus: requests of all the clients waiting at the same time
+are coalesced into a single update, after which each client is acknowledged.
+
+"""
+
+import os
+import threading
+import multiprocessing.connection
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+
+def _resource_tracker_id():
+    """Return a value identifying the resource tracker of this process.
+
+    Processes started with `multiprocessing` share the tracker of their
+    parent, through the same pipe.
+
+    """
+    st = os.fstat(resource_tracker.getfd())
+    return (st.st_dev, st.st_ino)
+
+
+class Ili9341DisplayServer(object):
+    """Class to share an `Ili9341Base` display with other processes.
+
+    Usage:
+
+        server = Ili9341DisplayServer(lcd, address="/tmp/ili9341.sock")
+        server.serve_forever()
+
+    """
+
+    def __init__(self, lcd, address=None, authkey=None, name=None):
+        """Initialize Ili9341DisplayServer class.
+
+        Args:
+
+        - lcd: (Ili9341Base) The display to share. Its framebuffer is moved
+          to shared memory, keeping the contents. The display must not be
+          rotated while shared, as that replaces the framebuffer.
+
+        - address: (str|tuple) Address to listen on for clients, as accepted
+          by `multiprocessing.connection.Listener`, e.g. a Unix socket path or
+          a (<host>, <port>) tuple. If `None`, a free address is picked. See
+          `address`.
+
+        - authkey: (bytes) If given, clients must authenticate with this key.
+
+        - name: (str) Name of the shared memory block. If `None`, a unique
+          name is picked.
+
+        """
+        self._lcd = lcd
+
+        # Move the framebuffer to shared memory.
+        # ---------------------------------------------------------------,
+        framebuff = lcd.framebuff
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True, size=framebuff.nbytes)
+        shared = np.ndarray(
+            framebuff.shape, dtype=np.uint8, buffer=self._shm.buf)
+        shared[...] = framebuff
+        lcd.framebuff = shared
+        # ---------------------------------------------------------------'
+
+        self._authkey = authkey
+        self._listener = multiprocessing.connection.Listener(
+            address, authkey=authkey)
+
+        # Presents waiting for the next update, as (<connection>,
+        # <regions>, <ack>) tuples.
+        self._cond = threading.Condition()
+        self._requests = []
+        self._closing = False
+        self._accepting = False
+        self._n_frames = 0
+
+        self._threads = []
+        self._connections = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def address(self):
+        """The address clients connect to."""
+        return self._listener.address
+
+    @property
+    def shm_name(self):
+        """Name of the shared memory block holding the framebuffer."""
+        return self._shm.name
+
+    @property
+    def n_frames(self):
+        """Number of updates done on behalf of the clients."""
+        return self._n_frames
+
+    def _start_thread(self, target, *args):
+        t = threading.Thread(target=target, args=args, daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def start(self):
+        """Start serving clients in background threads."""
+        self._start_thread(self._present_loop)
+        self._start_thread(self._accept_loop)
+
+    def serve_forever(self):
+        """Serve clients until `close()` is called from another thread."""
+        self._start_thread(self._present_loop)
+        self._accept_loop()
+
+    def _accept_loop(self):
+        self._accepting = True
+        try:
+            while not self._closing:
+                try:
+                    conn = self._listener.accept()
+                except (OSError, EOFError,
+                        multiprocessing.AuthenticationError):
+                    continue
+
+                if self._closing:
+                    conn.close()
+                    break
+
+                conn.send((
+                    "hello",
+                    self._shm.name,
+                    self._lcd.framebuff.shape,
+                    _resource_tracker_id()))
+                self._connections.append(conn)
+
+                # Client threads stay blocked on recv() until their client
+                # goes away, closing the connection doesn't wake them. They
+                # only queue requests, so they aren't waited for on close.
+                threading.Thread(
+                    target=self._client_loop, args=(conn,),
+                    daemon=True).start()
+        finally:
+            self._accepting = False
+
+    def _client_loop(self, conn):
+        try:
+            while True:
+                msg = conn.recv()
+                if msg[0] == "present":
+                    _, regions, ack = msg
+                    with self._cond:
+                        self._requests.append((conn, regions, ack))
+                        self._cond.notify_all()
+                elif msg[0] == "close":
+                    break
+        except (OSError, EOFError):
+            pass
+        except (TypeError, ValueError):
+            # Raised by recv() when close() closes the connection under it.
+            if not self._closing:
+                raise
+        finally:
+            conn.close()
+
+    def _present_loop(self):
+        while True:
+            with self._cond:
+                while not self._requests:
+                    if self._closing:
+                        return
+                    self._cond.wait()
+
+                requests = self._requests
+                self._requests = []
+
+            # A request without regions needs the whole frame compared, which
+            # also covers the regions of all the others.
+            # ---------------------------------------------------------------,
+            if any(regions is None for _, regions, _ in requests):
+                damage = None
+            else:
+                damage = [r for _, regions, _ in requests for r in regions]
+            # ---------------------------------------------------------------'
+
+            try:
+                self._lcd.update(regions=damage)
+            except Exception as e:
+                reply = ("error", repr(e))
+            else:
+                self._n_frames += 1
+                reply = ("ack", self._n_frames)
+
+            for conn, _, ack in requests:
+                if not ack:
+                    continue
+                try:
+                    conn.send(reply)
+                except (OSError, EOFError):
+                    pass
+
+    def close(self):
+        """Stop serving, and release the shared memory.
+
+        The display gets a private copy of the framebuffer back.
+
+        """
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+
+        # Closing the listener doesn't interrupt a blocked accept(), so wake
+        # it up with a connection of our own. Only while it runs, as the
+        # authentication would otherwise wait for it forever.
+        # ---------------------------------------------------------------,
+        if self._accepting:
+            try:
+                multiprocessing.connection.Client(
+                    self.address, authkey=self._authkey).close()
+            except (OSError, EOFError, multiprocessing.AuthenticationError):
+                pass
+
+        self._listener.close()
+        # ---------------------------------------------------------------'
+
+        for conn in self._connections:
+            conn.close()
+
+        # Let the pending presents finish before unmapping the framebuffer.
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join(timeout=1.0)
+
+        self._lcd.framebuff = self._lcd.framebuff.copy()
+        self._shm.close()
+        self._shm.unlink()
+
+
+class Ili9341DisplayClient(object):
+    """Class to draw on a display shared by an `Ili9341DisplayServer`."""
+
+    def __init__(self, address, authkey=None):
+        """Initialize Ili9341DisplayClient class.
+
+        Args:
+
+        - address: (str|tuple) Address of the server.
+
+        - authkey: (bytes) Key to authenticate with, if the server needs one.
+
+        """
+        self._conn = multiprocessing.connection.Client(
+            address, authkey=authkey)
+
+        msg, shm_name, shape, tracker_id = self._conn.recv()
+        if msg != "hello":
+            raise RuntimeError("Unexpected message from the display server!")
+
+        # The server owns the shared memory, so it must not be cleaned up
+        # when this process exits. Before Python 3.13, attaching always
+        # registers it for cleanup. A tracker shared with the server keeps a
+        # single registration, which the server removes when unlinking, so
+        # only a tracker of our own must forget it.
+        # ---------------------------------------------------------------,
+        try:
+            self._shm = shared_memory.SharedMemory(name=shm_name, track=False)
+        except TypeError:
+            self._shm = shared_memory.SharedMemory(name=shm_name)
+            if _resource_tracker_id() != tracker_id:
+                resource_tracker.unregister(self._shm._name, "shared_memory")
+        # ---------------------------------------------------------------'
+
+        self._framebuff = np.ndarray(
+            shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._damage = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def framebuff(self):
+        """The shared framebuffer of the display.
+
+        Pixels written here are seen by the server, and by all the other
+        clients, right away. They are sent to the display on `present()`.
+
+        """
+        return self._framebuff
+
+    def invalidate(self, x, y, w, h):
+        """Declare an area of the framebuffer as changed, to be sent on the
+        next `present()`."""
+        self._damage.append((x, y, w, h))
+
+    def present(self, regions=None, wait=True):
+        """Ask the server to send the changes to the display.
+
+        Args:
+
+        - regions: (list) Optional (x, y, w, h) areas which changed, in
+          addition to those declared with `invalidate()`. If there are none,
+          the server finds the changes by comparing the whole frame.
+
+        - wait: (bool) Whether to wait until the changes are sent. The
+          framebuffer areas being presented shouldn't be modified before
+          then, as the server may be reading them.
+
+        Returns the number of the frame the changes were sent with, or `None`
+        if not waiting. Raises `RuntimeError` if the server failed to update
+        the display.
+
+        """
+        damage = self._damage + list(regions or [])
+        self._damage = []
+
+        self._conn.send(("present", damage or None, wait))
+        if not wait:
+            return None
+
+        msg, result = self._conn.recv()
+        if msg == "error":
+            raise RuntimeError(
+                "Display server failed to update: {}".format(result))
+        return result
+
+    def close(self):
+        """Disconnect from the server."""
+        try:
+            self._conn.send(("close",))
+        except (OSError, EOFError):
+            pass
+        self._conn.close()
+
+        self._framebuff = None
+        self._shm.close()
@@ -0,0 +1,235 @@
+"""This module implements a simulated ILI9341 display, which needs neither SPI
+nor GPIO hardware.
+
+The simulator decodes the command stream produced by `Ili9341Base` into an
+in-memory graphics RAM (GRAM), while counting the bytes, SPI transactions and
+DC/X toggles that would have been put on the wire. It is useful for
+benchmarking and regression-testing the driver without a panel attached.
+
+"""
+
+import numpy as np
+
+from .ili9341_base import (
+    Ili9341Base,
+    ILI9341_TFTWIDTH,
+    ILI9341_TFTHEIGHT,
+    ILI9341_SWRESET,
+    ILI9341_CASET,
+    ILI9341_PASET,
+    ILI9341_RAMWR,
+    ILI9341_MADCTL,
+    ILI9341_VSCRDEF,
+    ILI9341_VSCRSADD,
+    ILI9341_MADCTL_ROW_ACCESS_REVERSED,
+    ILI9341_MADCTL_COL_ACCESS_REVERSED,
+    ILI9341_MADCTL_ROW_COL_EXCHANGE)
+
+
+# Number of parameter bytes for the commands the simulator understands.
+SIM_CMD_PARAM_COUNTS = {
+    ILI9341_CASET: 4,
+    ILI9341_PASET: 4,
+    ILI9341_MADCTL: 1,
+    ILI9341_VSCRDEF: 6,
+    ILI9341_VSCRSADD: 2,
+}
+
+
+class Ili9341Sim(Ili9341Base):
+    """Class to emulate an ILI9341 display in memory.
+
+    The physical GRAM is exposed as `gram`, a (320, 240) array of native
+    RGB565 values indexed by (<page>, <column>). With the default MADCTL
+    value, framebuffer pixel (y, x) lands on `gram[x, y]`. The image seen on
+    the panel, which also depends on the vertical scrolling registers, is
+    returned by `screen()`.
+
+    """
+
+    def __init__(
+            self,
+            spi_clock_hz=42_000_000,
+            decode=True,
+            **kwargs):
+        """Initialize Ili9341Sim class.
+
+        Args:
+
+        - spi_clock_hz: (int) SPI clock frequency to assume when estimating
+          bus time, in Hz.
+
+        - decode: (bool) Whether to decode the command stream into the GRAM.
+          If set to `False`, only the bus counters are maintained, which
+          makes the simulator a near no-op backend for benchmarking.
+
+        - Extra keyword arguments are forwarded to `Ili9341Base` class.
+
+        """
+        self._decode = decode
+
+        # Physical GRAM, (<page>, <column>).
+        self.gram = np.zeros(
+            (ILI9341_TFTWIDTH, ILI9341_TFTHEIGHT), dtype=np.uint16)
+
+        self._dc = None
+        self.reset_counters()
+        self._reset_registers()
+
+        super().__init__(spi_clock_hz=spi_clock_hz, **kwargs)
+
+    def reset_counters(self):
+        """Reset all bus counters to zero."""
+        self.n_bytes = 0
+        self.n_transactions = 0
+        self.n_dc_writes = 0
+        self.n_dc_toggles = 0
+        self.n_commands = 0
+
+    def estimated_bus_time(self):
+        """Return the time (in seconds) the counted bytes would take on the
+        wire at the configured SPI clock, ignoring per-transaction overhead.
+
+        """
+        return self.n_bytes * 8 / self._spi_clock_hz
+
+    def _reset_registers(self):
+        self._madctl = 0
+        self._col_range = (0, ILI9341_TFTHEIGHT - 1)
+        self._page_range = (0, ILI9341_TFTWIDTH - 1)
+        self._scroll_def = (0, ILI9341_TFTWIDTH, 0)
+        self._scroll_start = 0
+
+        self._cmd = None
+        self._params = bytearray()
+        self._pending_byte = None
+        self._ptr = 0
+
+    def _spi_write(self, buff):
+        data = np.frombuffer(buff, dtype=np.uint8)
+        self.n_bytes += len(data)
+        self.n_transactions += 1
+
+        if not self._decode or len(data) == 0:
+            return
+
+        if self._dc == 0:
+            for cmd in data:
+                self._begin_cmd(int(cmd))
+        else:
+            self._feed_data(data)
+
+    def _set_dc(self, level):
+        self.n_dc_writes += 1
+        if self._dc != level:
+            self.n_dc_toggles += 1
+            self._dc = level
+
+    def _switch_to_ctrl_mode(self):
+        self._set_dc(0)
+
+    def _switch_to_data_mode(self):
+        self._set_dc(1)
+
+    def _do_hardware_reset(self):
+        self._reset_registers()
+
+    def _begin_cmd(self, cmd):
+        self.n_commands += 1
+        self._cmd = cmd
+        self._params = bytearray()
+        self._pending_byte = None
+
+        if cmd == ILI9341_SWRESET:
+            self._reset_registers()
+        elif cmd == ILI9341_RAMWR:
+            self._ptr = 0
+
+    def _feed_data(self, data):
+        if self._cmd == ILI9341_RAMWR:
+            self._feed_pixels(data)
+
+        elif self._cmd in SIM_CMD_PARAM_COUNTS:
+            self._params += data.tobytes()
+            if len(self._params) == SIM_CMD_PARAM_COUNTS[self._cmd]:
+                self._apply_params(self._cmd, self._params)
+
+    def _apply_params(self, cmd, params):
+        if cmd == ILI9341_CASET:
+            self._col_range = (
+                (params[0] << 8) | params[1], (params[2] << 8) | params[3])
+        elif cmd == ILI9341_PASET:
+            self._page_range = (
+                (params[0] << 8) | params[1], (params[2] << 8) | params[3])
+        elif cmd == ILI9341_MADCTL:
+            self._madctl = params[0]
+        elif cmd == ILI9341_VSCRDEF:
+            self._scroll_def = (
+                (params[0] << 8) | params[1],
+                (params[2] << 8) | params[3],
+                (params[4] << 8) | params[5])
+        elif cmd == ILI9341_VSCRSADD:
+            self._scroll_start = (params[0] << 8) | params[1]
+
+    def screen(self):
+        """Return the image shown on the panel, as a (320, 240) array indexed
+        like `gram`, with vertical scrolling applied."""
+        tfa, vsa, bfa = self._scroll_def
+        if tfa + vsa + bfa != ILI9341_TFTWIDTH or vsa == 0:
+            # Invalid scroll definition; the controller behaviour is undefined.
+            return self.gram.copy()
+
+        lines = np.arange(ILI9341_TFTWIDTH)
+        in_area = (lines >= tfa) & (lines < tfa + vsa)
+        lines[in_area] = (
+            tfa + (lines[in_area] - tfa + self._scroll_start - tfa) % vsa)
+
+        return self.gram[lines]
+
+    def _logical_size(self):
+        """Return the (<n-columns>, <n-pages>) addressable by CASET/PASET
+        under the current MADCTL value."""
+        if self._madctl & ILI9341_MADCTL_ROW_COL_EXCHANGE:
+            return (ILI9341_TFTWIDTH, ILI9341_TFTHEIGHT)
+        return (ILI9341_TFTHEIGHT, ILI9341_TFTWIDTH)
+
+    def _feed_pixels(self, data):
+        # Re-attach a byte left over from the previous transaction.
+        if self._pending_byte is not None:
+            data = np.concatenate(([self._pending_byte], data)).astype(np.uint8)
+            self._pending_byte = None
+
+        if len(data) % 2:
+            self._pending_byte = data[-1]
+            data = data[:-1]
+
+        if len(data) == 0:
+            return
+
+        values = data.view(">u2").astype(np.uint16)
+
+        sc, ec = self._col_range
+        sp, ep = self._page_range
+        n_cols, n_pages = self._logical_size()
+        if sc > ec or sp > ep or ec >= n_cols or ep >= n_pages:
+            # Invalid window; the real controller behaviour is undefined.
+            return
+
+        w = ec - sc + 1
+        h = ep - sp + 1
+
+        k = (self._ptr + np.arange(len(values))) % (w * h)
+        self._ptr = (self._ptr + len(values)) % (w * h)
+
+        cols = sc + k % w
+        pages = sp + k // w
+
+        if self._madctl & ILI9341_MADCTL_COL_ACCESS_REVERSED:
+            cols = (n_cols - 1) - cols
+        if self._madctl & ILI9341_MADCTL_ROW_ACCESS_REVERSED:
+            pages = (n_pages - 1) - pages
+
+        if self._madctl & ILI9341_MADCTL_ROW_COL_EXCHANGE:
+            self.gram[cols, pages] = values
+        else:
+            self.gram[pages, cols] = values
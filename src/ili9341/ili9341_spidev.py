@@ -17,6 +17,21 @@ from .ili9341_base import Ili9341Base
 
 RX_SPIDEV_DEVICE_NUMS = re.compile(r"/dev/spidev([\d+])\.([\d+])")
 
+# Kernel parameter holding the maximum size of a single spidev transfer.
+SPIDEV_BUFSIZ_PATH = "/sys/module/spidev/parameters/bufsiz"
+
+# Default of the spidev kernel module, used if the parameter can't be read.
+SPIDEV_DEFAULT_BUFSIZ = 4096
+
+
+def read_spidev_bufsiz(path=SPIDEV_BUFSIZ_PATH):
+    """Read the maximum size of a single spidev transfer from sysfs."""
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return SPIDEV_DEFAULT_BUFSIZ
+
 
 class Ili9341Spidev(Ili9341Base):
     """Class to manipulate ILI9341 SPI displays using python-spidev and
@@ -24,6 +39,11 @@ class Ili9341Spidev(Ili9341Base):
 
     """
 
+    # Each transaction is a write() on the spidev device, queued and woken up
+    # by the kernel SPI driver, and each DC/X change a GPIO line ioctl through
+    # libgpiod.
+    DEFAULT_TRANSACTION_COST_BYTES = 128
+
     def __init__(
             self,
             spidev_device_path,
@@ -31,6 +51,7 @@ class Ili9341Spidev(Ili9341Base):
             dcx_pin_id,
             rst_pin_id=None,
             spi_clock_hz=42_000_000,
+            spi_data_chunk_size=None,
             **kwargs):
         """Initialize Ili9341Spidev class.
 
@@ -49,9 +70,25 @@ class Ili9341Spidev(Ili9341Base):
           pin of the display. Can be set to `None` if this pin is connected to
           +3.3V, disabling hardware reset.
 
+        - spi_data_chunk_size: (int) Size of each SPI data transaction. If
+          `None`, the data of a command is handed to the spidev library in one
+          call, which splits it into transfers of the kernel buffer size read
+          from `/sys/module/spidev/parameters/bufsiz`. Explicit sizes must not
+          exceed that buffer size.
+
         - Extra keyword arguments are forwarded to `Ili9341Base` class.
 
         """
+        self._spi_bufsiz = read_spidev_bufsiz()
+        if spi_data_chunk_size is None:
+            # Chunking is left to `writebytes2`, which splits the data into
+            # kernel buffer sized transfers without returning to python.
+            spi_data_chunk_size = 0
+        elif spi_data_chunk_size > self._spi_bufsiz:
+            raise ValueError(
+                "SPI data chunk size can not exceed the spidev kernel buffer"
+                " size of {} bytes!".format(self._spi_bufsiz))
+
         m = RX_SPIDEV_DEVICE_NUMS.match(spidev_device_path)
         if m is None:
             raise ValueError(
@@ -90,7 +127,21 @@ class Ili9341Spidev(Ili9341Base):
             consumer="Ili9341Spidev_display_driver",
             config=line_request_config)
 
-        super().__init__(**kwargs)
+        super().__init__(
+            spi_data_chunk_size=spi_data_chunk_size,
+            spi_clock_hz=spi_clock_hz,
+            **kwargs)
+
+    @property
+    def spi_bufsiz(self):
+        """Maximum size of a single spidev transfer, in bytes."""
+        return self._spi_bufsiz
+
+    def _autotune_chunk_sizes(self):
+        # Anything up to the kernel buffer size, or no chunking at all.
+        return [
+            s for s in (1024, 2048, 4096, 8192, 16384, 65536)
+            if s <= self._spi_bufsiz] + [0]
 
     def __del__(self):
         """Do cleanup."""
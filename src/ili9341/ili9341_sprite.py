@@ -0,0 +1,131 @@
+"""This module implements a cache of images pre-converted for ILI9341 displays.
+
+Images drawn repeatedly, like icons and backgrounds, are converted to wire
+order RGB565 once, and the result is reused by `Ili9341Base.blit()` as long as
+it stays in the cache. The least recently used images are evicted first once
+the cache exceeds its size limit.
+
+"""
+
+import hashlib
+import collections
+
+import numpy as np
+
+
+class Ili9341Sprite(object):
+    """An image along with its pixels in wire order RGB565."""
+
+    def __init__(self, pixels, wire):
+        """Initialize Ili9341Sprite class.
+
+        Args:
+
+        - pixels: (numpy.ndarray) The image as drawn into the framebuffer.
+
+        - wire: (numpy.ndarray) The (<height>, <width>) wire order RGB565
+          values of the image, ready to be sent.
+
+        """
+        self.pixels = pixels
+        self.wire = wire
+
+    @property
+    def shape(self):
+        """The (<height>, <width>) of the image, in pixels."""
+        return self.wire.shape
+
+    @property
+    def nbytes(self):
+        """Memory held by the sprite, in bytes."""
+        return self.pixels.nbytes + self.wire.nbytes
+
+
+def content_key(image):
+    """Return a cache key identifying an image by its contents."""
+    image = np.ascontiguousarray(image)
+    digest = hashlib.blake2b(image, digest_size=16).digest()
+    return (image.shape, image.dtype.str, digest)
+
+
+class Ili9341SpriteCache(object):
+    """Class to keep recently used sprites, up to a total size."""
+
+    def __init__(self, max_bytes=1 << 20):
+        """Initialize Ili9341SpriteCache class.
+
+        Args:
+
+        - max_bytes: (int) Maximum memory held by the cached sprites, in
+          bytes. Sprites larger than this are never cached.
+
+        """
+        if max_bytes < 0:
+            raise ValueError("Sprite cache size can't be negative!")
+
+        self._max_bytes = max_bytes
+        self._sprites = collections.OrderedDict()
+        self._n_bytes = 0
+        self._n_hits = 0
+        self._n_misses = 0
+
+    def __len__(self):
+        return len(self._sprites)
+
+    def __contains__(self, key):
+        return key in self._sprites
+
+    @property
+    def max_bytes(self):
+        """Maximum memory held by the cached sprites, in bytes."""
+        return self._max_bytes
+
+    @property
+    def n_bytes(self):
+        """Memory held by the cached sprites, in bytes."""
+        return self._n_bytes
+
+    @property
+    def n_hits(self):
+        """Number of lookups which found a cached sprite."""
+        return self._n_hits
+
+    @property
+    def n_misses(self):
+        """Number of lookups which didn't find a cached sprite."""
+        return self._n_misses
+
+    def get(self, key):
+        """Return the sprite cached with `key`, or `None`."""
+        sprite = self._sprites.get(key)
+        if sprite is None:
+            self._n_misses += 1
+            return None
+
+        self._sprites.move_to_end(key)
+        self._n_hits += 1
+        return sprite
+
+    def put(self, key, sprite):
+        """Cache a sprite with `key`, evicting the least recently used
+        sprites as needed."""
+        self.discard(key)
+        if sprite.nbytes > self._max_bytes:
+            return
+
+        self._sprites[key] = sprite
+        self._n_bytes += sprite.nbytes
+        while self._n_bytes > self._max_bytes:
+            _, evicted = self._sprites.popitem(last=False)
+            self._n_bytes -= evicted.nbytes
+
+    def discard(self, key):
+        """Remove the sprite cached with `key`, if any."""
+        sprite = self._sprites.pop(key, None)
+        if sprite is not None:
+            self._n_bytes -= sprite.nbytes
+
+    def clear(self):
+        """Remove all the cached sprites."""
+        self._sprites.clear()
+        self._n_bytes = 0
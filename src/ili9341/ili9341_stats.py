@@ -0,0 +1,145 @@
+"""This module implements rolling statistics of ILI9341 display updates.
+
+Each update is recorded as a sample holding the time spent in each stage of
+the update along with what was sent over the bus. Comparing the time spent
+converting and diffing against the time spent transmitting, and the bus time
+the sent bytes need at the configured SPI clock against the transmit time,
+tells whether a display is CPU-bound or bus-bound.
+
+"""
+
+import collections
+
+import numpy as np
+
+
+# Fields of an update sample.
+# -------------------------------------------------------------------,
+UPDATE_STATS_FIELDS = (
+    # Time spent converting the framebuffer to RGB565, in seconds.
+    "convert_time",
+
+    # Time spent finding the changed areas, in seconds.
+    "diff_time",
+
+    # Time spent sending the changed areas, in seconds.
+    "transmit_time",
+
+    # Total time of the update, in seconds.
+    "update_time",
+
+    # Number of areas sent, and their total number of pixels.
+    "n_regions",
+    "n_pixels",
+
+    # Bytes, SPI transactions and DC/X line toggles issued.
+    "n_bytes",
+    "n_transactions",
+    "n_dc_toggles",
+
+    # Time the sent bytes take on the wire at the SPI clock, in seconds.
+    "bus_time",
+)
+# -------------------------------------------------------------------'
+
+
+class Ili9341UpdateStats(object):
+    """Class to keep statistics of the most recent display updates."""
+
+    def __init__(self, spi_clock_hz, window=100):
+        """Initialize Ili9341UpdateStats class.
+
+        Args:
+
+        - spi_clock_hz: (int) SPI clock frequency, in Hz. Used to compute the
+          bus time of the sent bytes. If `None`, bus times are zero.
+
+        - window: (int) Number of most recent updates to keep.
+
+        """
+        if window < 1:
+            raise ValueError("Statistics window must be positive!")
+
+        self._spi_clock_hz = spi_clock_hz
+        self._samples = collections.deque(maxlen=window)
+        self._timestamps = collections.deque(maxlen=window)
+        self._n_updates = 0
+
+    @property
+    def n_updates(self):
+        """Number of updates recorded since the last reset."""
+        return self._n_updates
+
+    @property
+    def last(self):
+        """The sample of the last update, as a dictionary, or `None`."""
+        return self._samples[-1] if self._samples else None
+
+    @property
+    def fps(self):
+        """Effective number of updates per second within the window."""
+        t = self._timestamps
+        if len(t) < 2 or t[-1] <= t[0]:
+            return 0.0
+        return (len(t) - 1) / (t[-1] - t[0])
+
+    @property
+    def bus_utilization(self):
+        """Fraction of wall time within the window the bus would be busy
+        sending the recorded bytes at the SPI clock."""
+        t = self._timestamps
+        if len(t) < 2 or t[-1] <= t[0]:
+            return 0.0
+
+        # The first sample ends the window start, so isn't part of it.
+        bus_time = sum(s["bus_time"] for s in list(self._samples)[1:])
+        return bus_time / (t[-1] - t[0])
+
+    def reset(self):
+        """Forget all the recorded updates."""
+        self._samples.clear()
+        self._timestamps.clear()
+        self._n_updates = 0
+
+    def record(self, sample, timestamp):
+        """Record an update sample, finished at `timestamp` seconds.
+
+        The sample is a dictionary with the fields listed in
+        `UPDATE_STATS_FIELDS`, except "bus_time", which is filled in.
+
+        """
+        n_bytes = sample["n_bytes"]
+        sample["bus_time"] = (
+            n_bytes * 8 / self._spi_clock_hz if self._spi_clock_hz else 0.0)
+
+        self._samples.append(sample)
+        self._timestamps.append(timestamp)
+        self._n_updates += 1
+
+    def _values(self, field):
+        return np.array([s[field] for s in self._samples], dtype=np.float64)
+
+    def mean(self, field):
+        """Mean of a sample field within the window."""
+        v = self._values(field)
+        return float(v.mean()) if len(v) else 0.0
+
+    def p95(self, field):
+        """95th percentile of a sample field within the window."""
+        v = self._values(field)
+        return float(np.percentile(v, 95)) if len(v) else 0.0
+
+    def summary(self):
+        """Return a dictionary with the mean and 95th percentile of each
+        sample field within the window, as "<field>_mean" and "<field>_p95",
+        along with the effective fps and bus utilization."""
+        result = {"n_updates": self._n_updates}
+        for field in UPDATE_STATS_FIELDS:
+            v = self._values(field)
+            result[field + "_mean"] = float(v.mean()) if len(v) else 0.0
+            result[field + "_p95"] = (
+                float(np.percentile(v, 95)) if len(v) else 0.0)
+
+        result["fps"] = self.fps
+        result["bus_utilization"] = self.bus_utilization
+        return result
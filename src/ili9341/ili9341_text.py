@@ -0,0 +1,215 @@
+"""This module implements text drawing on ILI9341 displays.
+
+A font is rasterized once into a glyph atlas of equally sized cells. Colored
+glyph cells are converted to RGB565 on first use and kept in the sprite cache
+of the display, so drawing text costs no conversion in the steady state. Text
+fields remember what they show, and only send the cells which changed: ticking
+a 6 digit counter sends at most six small windows, without scanning the
+frame.
+
+"""
+
+import numpy as np
+
+import cv2
+
+
+# Characters rasterized by default: printable ASCII.
+TEXT_DEFAULT_CHARS = "".join(chr(c) for c in range(32, 127))
+
+
+class Ili9341Font(object):
+    """Class to hold the glyph atlas of a font rendered with OpenCV.
+
+    Glyphs are centered in cells of the same size, so text is laid out as on
+    a monospace font.
+
+    """
+
+    def __init__(
+            self,
+            font_face=cv2.FONT_HERSHEY_SIMPLEX,
+            font_scale=1.0,
+            thickness=1,
+            chars=TEXT_DEFAULT_CHARS):
+        """Initialize Ili9341Font class.
+
+        Args:
+
+        - font_face: (int) One of the OpenCV Hershey fonts.
+
+        - font_scale: (float) Scale factor of the font.
+
+        - thickness: (int) Thickness of the glyph strokes, in pixels.
+
+        - chars: (str) Characters to rasterize. Drawing any other character
+          raises `ValueError`.
+
+        """
+        self._key = (font_face, font_scale, thickness)
+
+        # Find the cell size fitting all the glyphs.
+        # ---------------------------------------------------------------,
+        sizes = {}
+        max_w = max_h = max_baseline = 0
+        for ch in chars:
+            (w, h), baseline = cv2.getTextSize(
+                ch, font_face, font_scale, thickness)
+            sizes[ch] = w
+            max_w = max(max_w, w)
+            max_h = max(max_h, h)
+            max_baseline = max(max_baseline, baseline)
+
+        cell_w = max_w + thickness
+        cell_h = max_h + max_baseline + thickness
+        # ---------------------------------------------------------------'
+
+        # Glyph coverage of each cell, (<n-chars>, <cell-height>, <cell-width>).
+        self._atlas = np.zeros((len(chars), cell_h, cell_w), dtype=np.uint8)
+        self._indices = {}
+        for i, ch in enumerate(chars):
+            self._indices[ch] = i
+            cv2.putText(
+                self._atlas[i], ch,
+                ((cell_w - sizes[ch]) // 2, max_h + thickness // 2),
+                font_face, font_scale, 255, thickness, cv2.LINE_AA)
+
+    @property
+    def key(self):
+        """A hashable value identifying the font."""
+        return self._key
+
+    @property
+    def cell_size(self):
+        """The (<width>, <height>) of a glyph cell, in pixels."""
+        return (self._atlas.shape[2], self._atlas.shape[1])
+
+    def glyph(self, ch):
+        """Return the coverage of a character's cell, from 0 to 255."""
+        i = self._indices.get(ch)
+        if i is None:
+            raise ValueError("Character {!r} is not in the font!".format(ch))
+        return self._atlas[i]
+
+    def cell(self, ch, fg, bg):
+        """Return the cell of a character drawn with the given foreground and
+        background colors, as a (<height>, <width>, <rgb-color>) image."""
+        alpha = self.glyph(ch)[:, :, None] / 255.0
+        fg = np.asarray(fg, dtype=np.float64)
+        bg = np.asarray(bg, dtype=np.float64)
+        return np.rint(bg + (fg - bg) * alpha).astype(np.uint8)
+
+    def cell_indexed(self, ch, fg, bg):
+        """Return the cell of a character drawn with the given foreground and
+        background palette indices."""
+        return np.where(self.glyph(ch) >= 128, fg, bg).astype(np.uint8)
+
+
+class Ili9341Text(object):
+    """Class to draw a text field on an `Ili9341Base` display.
+
+    The field remembers the characters and colors it shows, and only redraws
+    the cells which change. Cells are sent with `Ili9341Base.blit()`, keeping
+    the framebuffer and the last sent frame in sync.
+
+    """
+
+    def __init__(self, lcd, font, x, y, fg=(0xFF, 0xFF, 0xFF), bg=(0, 0, 0)):
+        """Initialize Ili9341Text class.
+
+        Args:
+
+        - lcd: (Ili9341Base) The display to draw on.
+
+        - font: (Ili9341Font) The font to draw with.
+
+        - x, y: (int) Position of the top-left corner of the field.
+
+        - fg, bg: (tuple) Default foreground and background colors, or
+          palette indices in indexed color mode.
+
+        """
+        self._lcd = lcd
+        self._font = font
+        self._x = x
+        self._y = y
+        self._fg = fg
+        self._bg = bg
+
+        # (<char>, <fg>, <bg>) shown in each cell, by (<line>, <column>).
+        # Cleared cells have no character nor foreground.
+        self._cells = {}
+        self._text = ""
+
+    @property
+    def text(self):
+        """The text shown."""
+        return self._text
+
+    def _color_key(self, color):
+        if np.isscalar(color):
+            return int(color)
+        return tuple(int(c) for c in color)
+
+    def _draw_cell(self, line, col, ch, fg, bg):
+        cell_w, cell_h = self._font.cell_size
+        x = self._x + col * cell_w
+        y = self._y + line * cell_h
+
+        # Cleared cells are filled with the background, the font may have no
+        # blank glyph.
+        if ch is None:
+            key = ("blank", self._font.cell_size, bg)
+        else:
+            key = ("glyph", self._font.key, ch, fg, bg)
+
+        if key in self._lcd.sprite_cache:
+            self._lcd.blit(None, x, y, key=key)
+        elif ch is None:
+            shape = (cell_h, cell_w) + np.shape(bg)
+            self._lcd.blit(np.full(shape, bg, np.uint8), x, y, key=key)
+        elif self._lcd.palette is not None:
+            self._lcd.blit(self._font.cell_indexed(ch, fg, bg), x, y, key=key)
+        else:
+            self._lcd.blit(self._font.cell(ch, fg, bg), x, y, key=key)
+
+    def draw(self, text, fg=None, bg=None):
+        """Show a text, sending only the cells which changed.
+
+        Lines are separated by newlines. Cells shown before but not covered
+        by the new text are cleared with the background color.
+
+        Args:
+
+        - text: (str) The text to show.
+
+        - fg, bg: (tuple) Foreground and background colors. If `None`, the
+          defaults of the field are used.
+
+        """
+        fg = self._color_key(self._fg if fg is None else fg)
+        bg = self._color_key(self._bg if bg is None else bg)
+
+        cells = {}
+        for line, chars in enumerate(text.split("\n")):
+            for col, ch in enumerate(chars):
+                # Fail before drawing anything on unknown characters.
+                self._font.glyph(ch)
+                cells[(line, col)] = (ch, fg, bg)
+
+        # Clear the cells no longer covered.
+        for pos in self._cells:
+            if pos not in cells:
+                cells[pos] = (None, None, bg)
+
+        for pos, cell in cells.items():
+            if self._cells.get(pos) != cell:
+                self._draw_cell(*pos, *cell)
+
+        self._cells = cells
+        self._text = text
+
+    def redraw(self):
+        """Draw all the cells again, e.g. after the display was cleared."""
+        for pos, cell in self._cells.items():
+            self._draw_cell(*pos, *cell)
@@ -0,0 +1,217 @@
+"""This module implements tracing of ILI9341 display updates, in the Chrome
+trace event format.
+
+Traces can be opened with `chrome://tracing` or https://ui.perfetto.dev, and
+show a timeline of each update, the RGB565 conversion, change detection,
+partial updates, SPI writes and DC/X line toggles, along with garbage
+collection pauses.
+
+Tracing is done by wrapping the methods of an attached display, so displays
+which are not attached to a tracer pay no overhead at all.
+
+"""
+
+import gc
+import os
+import json
+import time
+import threading
+import contextlib
+
+
+# Methods traced on attached displays, as (<method-name>, <span-name>,
+# <function-returning-span-args>) tuples.
+# -------------------------------------------------------------------,
+def _area_args(x1, y1, x2, y2, *rest):
+    return {"x1": x1, "y1": y1, "x2": x2, "y2": y2}
+
+
+TRACED_METHODS = (
+    ("_update_from", "update", None),
+    ("_prepare_update", "prepare_update", None),
+    ("_send_update", "send_update", None),
+    ("_convert_framebuff", "rgb565_convert", None),
+    ("_convert_area", "rgb565_convert_area",
+        lambda framebuff, *area: _area_args(*area)),
+    ("_find_updated_areas", "find_updated_areas", None),
+    ("_update_partial", "update_partial",
+        lambda new_data, *area: _area_args(*area)),
+    ("_spi_write", "spi_write", lambda buff: {"n_bytes": len(buff)}),
+    ("_switch_to_ctrl_mode", "dcx_ctrl", None),
+    ("_switch_to_data_mode", "dcx_data", None),
+    ("_flush_bus", "flush_bus", None),
+)
+# -------------------------------------------------------------------'
+
+
+def _now_us():
+    return time.perf_counter_ns() / 1000.0
+
+
+class Ili9341Tracer(object):
+    """Class to record a timeline of display updates as Chrome trace events.
+
+    Usage:
+
+        tracer = Ili9341Tracer()
+        tracer.attach(lcd)
+        ... # Update the display.
+        tracer.detach(lcd)
+        tracer.save("trace.json")
+
+    """
+
+    def __init__(self, trace_gc=True, max_events=1_000_000):
+        """Initialize Ili9341Tracer class.
+
+        Args:
+
+        - trace_gc: (bool) Whether to record garbage collection pauses while
+          any display is attached.
+
+        - max_events: (int) Maximum number of events to keep. Recording stops
+          once it is reached, to bound the memory use of long traces.
+
+        """
+        self._trace_gc = trace_gc
+        self._max_events = max_events
+        self._pid = os.getpid()
+        self._events = []
+        self._thread_names = {}
+
+        # Original methods of attached displays, by `id()` of the display.
+        self._attached = {}
+
+        self._gc_stime = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def events(self):
+        """The recorded trace events."""
+        return self._events
+
+    def _tid(self):
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+        return tid
+
+    def add_event(self, name, stime, etime, cat="ili9341", args=None):
+        """Record a complete event, spanning from `stime` to `etime` in
+        microseconds of `time.perf_counter_ns()`."""
+        if len(self._events) >= self._max_events:
+            return
+
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": stime,
+            "dur": etime - stime,
+            "pid": self._pid,
+            "tid": self._tid(),
+        }
+        if args:
+            event["args"] = args
+        self._events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name, cat="app", **args):
+        """Record the duration of a `with` block as an event, e.g. to show
+        application rendering alongside display updates."""
+        stime = _now_us()
+        try:
+            yield
+        finally:
+            self.add_event(name, stime, _now_us(), cat, args)
+
+    def _wrap(self, method, name, get_args):
+        def traced(*args, **kwargs):
+            stime = _now_us()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add_event(
+                    name, stime, _now_us(),
+                    args=get_args(*args) if get_args is not None else None)
+
+        return traced
+
+    def attach(self, lcd):
+        """Start tracing the updates of a display."""
+        if id(lcd) in self._attached:
+            return
+
+        # Shadow the methods with traced ones on the instance.
+        originals = {}
+        for method_name, name, get_args in TRACED_METHODS:
+            originals[method_name] = lcd.__dict__.get(method_name)
+            setattr(lcd, method_name, self._wrap(
+                getattr(lcd, method_name), name, get_args))
+
+        if not self._attached and self._trace_gc:
+            gc.callbacks.append(self._on_gc)
+        self._attached[id(lcd)] = (lcd, originals)
+
+    def detach(self, lcd):
+        """Stop tracing the updates of a display."""
+        if id(lcd) not in self._attached:
+            return
+
+        _, originals = self._attached.pop(id(lcd))
+        for method_name, original in originals.items():
+            if original is None:
+                del lcd.__dict__[method_name]
+            else:
+                setattr(lcd, method_name, original)
+
+        if not self._attached and self._trace_gc:
+            gc.callbacks.remove(self._on_gc)
+
+    def close(self):
+        """Detach all the displays."""
+        for lcd, _ in list(self._attached.values()):
+            self.detach(lcd)
+
+    def _on_gc(self, phase, info):
+        if phase == "start":
+            self._gc_stime = _now_us()
+        elif self._gc_stime is not None:
+            self.add_event(
+                "gc", self._gc_stime, _now_us(), cat="gc",
+                args={
+                    "generation": info["generation"],
+                    "collected": info["collected"],
+                })
+            self._gc_stime = None
+
+    def clear(self):
+        """Forget all the recorded events."""
+        self._events = []
+
+    def to_json(self):
+        """Return the trace as a Chrome trace event JSON object."""
+        names = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": self._pid,
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in self._thread_names.items()]
+
+        return {
+            "traceEvents": names + self._events,
+            "displayTimeUnit": "ms",
+        }
+
+    def save(self, path):
+        """Write the trace to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f)
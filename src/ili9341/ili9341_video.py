@@ -0,0 +1,273 @@
+"""This module implements a video playback pipeline for ILI9341 displays.
+
+Decoding, resizing/color conversion and sending to the display run as
+separate stages connected by bounded queues, so they overlap in time. Frames
+are shown on the timeline of the source; when the bus can't keep up, late
+frames are dropped instead of slowing playback down.
+
+"""
+
+import time
+import queue
+import threading
+
+import cv2
+
+
+# Weight of the latest sample in the moving average of the update time.
+VIDEO_UPDATE_TIME_SMOOTHING = 0.2
+
+# Frame rate to assume for sources which don't report one.
+VIDEO_DEFAULT_FPS = 30.0
+
+
+class Ili9341VideoPlayer(object):
+    """Class to play video files or camera streams on an `Ili9341Base`
+    display, keeping to the source frame rate."""
+
+    def __init__(
+            self,
+            lcd,
+            source,
+            fps=None,
+            transpose=False,
+            queue_size=4):
+        """Initialize Ili9341VideoPlayer class.
+
+        Args:
+
+        - lcd: (Ili9341Base) The display to play on.
+
+        - source: (str|int|cv2.VideoCapture) A video file path, a camera
+          index, or an already opened capture. Frames of files are shown at
+          their timestamps. Frames of cameras are shown as soon as possible,
+          dropping those which became stale in the meantime.
+
+        - fps: (float) Frame rate of the source. If `None`, the rate reported
+          by the source is used.
+
+        - transpose: (bool) Whether to swap the rows and columns of the source
+          frames, e.g. to show portrait videos on a display in a landscape
+          rotation. Frames are resized to fit the display afterwards, if
+          needed.
+
+        - queue_size: (int) Number of frames each stage may buffer ahead.
+
+        """
+        if isinstance(source, cv2.VideoCapture):
+            cap = source
+        else:
+            cap = cv2.VideoCapture(source)
+
+        if not cap.isOpened():
+            raise RuntimeError("Failed to open video source!")
+
+        self._lcd = lcd
+        self._cap = cap
+        self._live = cap.get(cv2.CAP_PROP_FRAME_COUNT) <= 0
+        self._fps = fps or cap.get(cv2.CAP_PROP_FPS) or VIDEO_DEFAULT_FPS
+        self._transpose = transpose
+
+        self._decoded = queue.Queue(maxsize=queue_size)
+        self._prepared = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+
+        self._start_time = None
+        self._update_time = 0.0
+        self._reset_stats()
+
+    @property
+    def source_fps(self):
+        """Frame rate of the source."""
+        return self._fps
+
+    @property
+    def stats(self):
+        """A dictionary with the source and achieved frame rates, along with
+        the number of frames shown, the number dropped by each stage, and the
+        average update time."""
+        elapsed = 0.0
+        if self._start_time is not None:
+            elapsed = time.perf_counter() - self._start_time
+
+        return {
+            "source_fps": self._fps,
+            "fps": self._n_shown / elapsed if elapsed > 0 else 0.0,
+            "shown": self._n_shown,
+            "dropped_decode": self._n_dropped_decode,
+            "dropped_prepare": self._n_dropped_prepare,
+            "dropped_transmit": self._n_dropped_transmit,
+            "update_time": self._update_time,
+        }
+
+    def _reset_stats(self):
+        self._n_shown = 0
+        self._n_dropped_decode = 0
+        self._n_dropped_prepare = 0
+        self._n_dropped_transmit = 0
+
+    def _clock(self):
+        """Return the current position on the playback timeline, in seconds,
+        or `None` if playback has not started."""
+        if self._start_time is None:
+            return None
+        return time.perf_counter() - self._start_time
+
+    def _is_late(self, pts, margin=0.0):
+        """Whether a frame would miss its display slot, if it took `margin`
+        seconds more to show it."""
+        now = self._clock()
+        return now is not None and now + margin > pts + 1.0 / self._fps
+
+    def _put(self, q, item):
+        """Put an item into a queue, giving up if playback is stopped."""
+        while not self._stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        while not self._stop_event.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return None
+
+    def _decode_loop(self):
+        index = 0
+        stime = time.perf_counter()
+        while not self._stop_event.is_set():
+            if not self._cap.grab():
+                break
+
+            if self._live:
+                pts = time.perf_counter() - stime
+            else:
+                pts = index / self._fps
+            index += 1
+
+            # Skip decoding frames which can't be shown in time anyway.
+            if not self._live and self._is_late(pts, self._update_time):
+                self._n_dropped_decode += 1
+                continue
+
+            ret, frame = self._cap.retrieve()
+            if not ret:
+                break
+
+            if not self._put(self._decoded, (pts, frame)):
+                return
+
+        self._put(self._decoded, None)
+
+    def _prepare_loop(self):
+        height, width = self._lcd.framebuff.shape[:2]
+        size = (width, height)
+        while True:
+            item = self._get(self._decoded)
+            if item is None:
+                break
+
+            pts, frame = item
+            if not self._live and self._is_late(pts, self._update_time):
+                self._n_dropped_prepare += 1
+                continue
+
+            if self._transpose:
+                frame = frame.swapaxes(0, 1)
+            if (frame.shape[1], frame.shape[0]) != size:
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+            if not self._put(self._prepared, (pts, frame)):
+                return
+
+        self._put(self._prepared, None)
+
+    def play(self, duration=None):
+        """Play the source on the display, until it ends, `duration` seconds
+        pass, or `stop()` is called from another thread.
+
+        Returns the playback statistics. See `stats`.
+
+        """
+        self._stop_event.clear()
+        self._start_time = None
+        self._reset_stats()
+
+        # Discard anything left over from an earlier, stopped playback.
+        for q in (self._decoded, self._prepared):
+            while not q.empty():
+                q.get_nowait()
+
+        threads = [
+            threading.Thread(
+                target=self._decode_loop,
+                name="Ili9341VideoDecode",
+                daemon=True),
+            threading.Thread(
+                target=self._prepare_loop,
+                name="Ili9341VideoPrepare",
+                daemon=True),
+        ]
+        for t in threads:
+            t.start()
+
+        try:
+            self._transmit_loop(duration)
+        finally:
+            self._stop_event.set()
+            for t in threads:
+                t.join()
+
+        return self.stats
+
+    def _transmit_loop(self, duration):
+        while True:
+            item = self._get(self._prepared)
+            if item is None:
+                break
+
+            pts, frame = item
+            if self._start_time is None:
+                # Start the timeline with the first frame.
+                self._start_time = time.perf_counter() - pts
+
+            if duration is not None and pts >= duration:
+                break
+
+            # Live frames are stale once newer ones are waiting. Frames of
+            # files are dropped if their slot has passed, unless there is
+            # nothing newer to show.
+            # ---------------------------------------------------------------,
+            if not self._prepared.empty() and (
+                    self._live or self._is_late(pts)):
+                self._n_dropped_transmit += 1
+                continue
+
+            if not self._live:
+                delay = pts - self._clock()
+                if delay > 0:
+                    time.sleep(delay)
+            # ---------------------------------------------------------------'
+
+            stime = time.perf_counter()
+            self._lcd.framebuff[:, :, :] = frame
+            self._lcd.update()
+            elapsed = time.perf_counter() - stime
+
+            self._update_time += VIDEO_UPDATE_TIME_SMOOTHING * (
+                elapsed - self._update_time)
+            self._n_shown += 1
+
+    def stop(self):
+        """Stop playback."""
+        self._stop_event.set()
+
+    def close(self):
+        """Release the video source."""
+        self._cap.release()
@@ -0,0 +1,264 @@
+"""This module implements a video wall, driving a grid of ILI9341 displays as
+one large canvas.
+
+The canvas is converted and compared against the last sent one in a single
+pass. The changed areas are then routed to the displays they overlap, and
+displays on independent buses are updated in parallel.
+
+"""
+
+import concurrent.futures
+
+import numpy as np
+
+from .ili9341_base import (
+    ILI9341_TFTWIDTH,
+    ILI9341_TFTHEIGHT,
+    _convert_to_wire)
+
+
+class Ili9341VideoWall(object):
+    """Class to drive a grid of `Ili9341Base` displays as a single canvas.
+
+    The framebuffer of each display is replaced by a view into the canvas, so
+    drawing on the canvas needs no copying. The displays must not be updated
+    directly while they are part of a wall, and their change detection
+    settings are not used; those of the wall are. Displays in indexed color
+    mode are not supported.
+
+    """
+
+    def __init__(self, displays, grid, buses=None):
+        """Initialize Ili9341VideoWall class.
+
+        Args:
+
+        - displays: (list) The `Ili9341Base` displays making up the wall, in
+          row-major order.
+
+        - grid: (tuple) Number of (<rows>, <columns>) of displays. Each
+          display covers a 240x320 area of the canvas.
+
+        - buses: (list) Bus identifier of each display. Displays with the same
+          identifier share a bus and are updated one after another, while
+          those on different buses are updated in parallel. If `None`, all
+          displays are assumed to share one bus.
+
+        """
+        rows, cols = grid
+        if rows < 1 or cols < 1 or len(displays) != rows * cols:
+            raise ValueError(
+                "Grid of {}x{} displays doesn't match the {} given!".format(
+                    rows, cols, len(displays)))
+
+        if any(lcd.framebuff.shape[:2] != (ILI9341_TFTHEIGHT, ILI9341_TFTWIDTH)
+               for lcd in displays):
+            raise ValueError("Displays in a wall must be in landscape rotation!")
+
+        if any(lcd.palette is not None for lcd in displays):
+            raise ValueError("Displays in indexed color mode can't be in a wall!")
+
+        if buses is None:
+            buses = [0] * len(displays)
+
+        if len(buses) != len(displays):
+            raise ValueError("There must be a bus identifier for each display!")
+
+        self._displays = list(displays)
+        self._grid = (rows, cols)
+        self._height = rows * ILI9341_TFTHEIGHT
+        self._width = cols * ILI9341_TFTWIDTH
+
+        # The canvas, and its RGB565 conversions. As with a single display,
+        # one of the converted buffers holds the last sent canvas.
+        # ---------------------------------------------------------------,
+        self._framebuff = np.zeros((self._height, self._width, 3), dtype=np.uint8)
+        self._wire_buffs = [
+            np.zeros((self._height, self._width), dtype=np.uint16),
+            np.zeros((self._height, self._width), dtype=np.uint16)]
+        self._wire_scratch = np.zeros(
+            (self._height, self._width), dtype=np.uint16)
+        self._diff_mask = np.zeros((self._height, self._width), dtype=bool)
+        self._old_data = None
+        # ---------------------------------------------------------------'
+
+        # Canvas area of each display, as (<x>, <y>, <area-slices>).
+        self._panel_areas = []
+        for i, lcd in enumerate(self._displays):
+            x = (i % cols) * ILI9341_TFTWIDTH
+            y = (i // cols) * ILI9341_TFTHEIGHT
+            area = (
+                slice(y, y + ILI9341_TFTHEIGHT),
+                slice(x, x + ILI9341_TFTWIDTH))
+            self._panel_areas.append((x, y, area))
+            lcd.framebuff = self._framebuff[area]
+
+        # Indices of the displays on each bus.
+        self._buses = {}
+        for i, bus in enumerate(buses):
+            self._buses.setdefault(bus, []).append(i)
+
+        self._executor = None
+        if len(self._buses) > 1:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(self._buses),
+                thread_name_prefix="Ili9341VideoWall")
+
+        # Damage regions declared with `invalidate()` since the last update,
+        # as inclusive (x1, y1, x2, y2) rectangles of the canvas.
+        self._damage = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def framebuff(self):
+        """A numpy array holding the pixel values of the whole canvas.
+
+        The layout is: (<height>, <width>, <rgb-color>)
+
+        """
+        return self._framebuff
+
+    @property
+    def displays(self):
+        """The displays of the wall, in row-major order."""
+        return list(self._displays)
+
+    @property
+    def shape(self):
+        """The (<height>, <width>) of the canvas, in pixels."""
+        return (self._height, self._width)
+
+    def invalidate(self, x, y, w, h):
+        """Declare an area of the canvas as changed.
+
+        See `Ili9341Base.invalidate()`.
+
+        """
+        if w < 0 or h < 0:
+            raise ValueError(
+                "Invalid damage region size: {}x{}".format(w, h))
+
+        x1 = max(x, 0)
+        y1 = max(y, 0)
+        x2 = min(x + w, self._width) - 1
+        y2 = min(y + h, self._height) - 1
+        if x1 <= x2 and y1 <= y2:
+            self._damage.append((x1, y1, x2, y2))
+
+    def _route_damage(self, damage):
+        """Split damage rectangles of the canvas into merged rectangles of
+        each display."""
+        panel_rects = []
+        for lcd, (px, py, _) in zip(self._displays, self._panel_areas):
+            rects = []
+            for x1, y1, x2, y2 in damage:
+                x1 = max(x1 - px, 0)
+                y1 = max(y1 - py, 0)
+                x2 = min(x2 - px, ILI9341_TFTWIDTH - 1)
+                y2 = min(y2 - py, ILI9341_TFTHEIGHT - 1)
+                if x1 <= x2 and y1 <= y2:
+                    rects.append((x1, y1, x2, y2))
+
+            if len(rects) > 1:
+                rects = lcd._merge_damage(rects)
+            panel_rects.append(rects)
+
+        return panel_rects
+
+    def _find_panel_rects(self, new_data):
+        """Compare the converted canvas against the last sent one, and find
+        the changed rectangles of each display."""
+        if self._old_data is None:
+            full = [(0, 0, ILI9341_TFTWIDTH - 1, ILI9341_TFTHEIGHT - 1)]
+            return [full] * len(self._displays)
+
+        mask = np.not_equal(new_data, self._old_data, out=self._diff_mask)
+        return [
+            lcd._merge_dirty_rects(mask[area]) if mask[area].any() else []
+            for lcd, (_, _, area) in zip(self._displays, self._panel_areas)]
+
+    def _send_panels(self, indices, new_data, panel_rects):
+        for i in indices:
+            rects = panel_rects[i]
+            if not rects:
+                continue
+
+            lcd = self._displays[i]
+            pixels = new_data[self._panel_areas[i][2]]
+            with lcd._update_lock, lcd._bus_batch():
+                for area in rects:
+                    lcd._update_partial(pixels, *area)
+
+                # The display's own shadow no longer matches its contents.
+                lcd._forget_sent_frame()
+
+    def update(self, regions=None):
+        """Update all the displays from the canvas.
+
+        Args:
+
+        - regions: (list) Optional (x, y, w, h) areas of the canvas which
+          changed. See `Ili9341Base.update()`.
+
+        """
+        if regions is not None:
+            for region in regions:
+                self.invalidate(*region)
+
+        damage = self._damage
+        self._damage = []
+
+        if damage and self._old_data is not None:
+            # Convert the damaged areas in place, no diff needed.
+            for x1, y1, x2, y2 in damage:
+                area = (slice(y1, y2 + 1), slice(x1, x2 + 1))
+                _convert_to_wire(
+                    self._framebuff[area],
+                    self._old_data[area],
+                    self._wire_scratch[area])
+
+            new_data = self._old_data
+            panel_rects = self._route_damage(damage)
+        else:
+            new_data = self._wire_buffs[0]
+            if new_data is self._old_data:
+                new_data = self._wire_buffs[1]
+
+            _convert_to_wire(self._framebuff, new_data, self._wire_scratch)
+            panel_rects = self._find_panel_rects(new_data)
+            self._old_data = new_data
+
+        # Update displays on independent buses in parallel.
+        # ---------------------------------------------------------------,
+        if self._executor is None:
+            for indices in self._buses.values():
+                self._send_panels(indices, new_data, panel_rects)
+            return
+
+        futures = [
+            self._executor.submit(
+                self._send_panels, indices, new_data, panel_rects)
+            for indices in self._buses.values()]
+        for f in futures:
+            f.result()
+        # ---------------------------------------------------------------'
+
+    def clear(self, color=(0, 0, 0)):
+        """Clear all the displays with a specific color."""
+        self._framebuff[:, :, :] = color
+        self.update()
+
+    def reset(self):
+        """Forget the last sent canvas, so the next update repaints all."""
+        self._old_data = None
+
+    def close(self):
+        """Stop the threads used for parallel updates."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
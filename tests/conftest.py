@@ -0,0 +1,8 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+# Hardware test scripts, and the procedures they share, are run by hand with
+# a display attached.
+collect_ignore_glob = ["run_*.py", "test_procedures.py"]
@@ -0,0 +1,119 @@
+import sys
+sys.path.append("../src/")
+
+import time
+import random
+
+from ili9341.ili9341_spidev import Ili9341Spidev
+from ili9341.ili9341_server import Ili9341DisplayServer, Ili9341DisplayClient
+
+
+CIRCUIT_GUIDE = """
+# ----------------------------------------------------------------,
+[RPi2B Compat. Host]   <---> [Display]
+==================================================================
+Pin-19/GPIO-10/MOSI    <---> MOSI (Main-Out-Sub-In)
+Pin-23/GPIO-11/SCLK    <---> SCLK (SPI-Clock)
+Pin-24/GPIO-8/SPI0-CE0 <---> CS/X (SPI-Chip-Select)
+Pin-22/GPIO-25         <---> DC/X (Data/Control Select for ILI9341)
+3.3V+                  <---> RST (We are not using reset pin)
+3.3V+                  <---> LED (No software illumination control)
+# ----------------------------------------------------------------'
+"""
+
+HW_CONFIGS = {
+    "rpi3": {
+        "spidev_device_path": "/dev/spidev0.0",
+        "gpiod_device_path": "/dev/gpiochip0",
+        "dcx_pin_id": 25,
+        "rst_pin_id": None,
+        "spi_clock_hz": 42_000_000,
+        "spi_data_chunk_size": None,  # Sized by the kernel buffer.
+        "circuit_guide": CIRCUIT_GUIDE,
+    },
+
+    "rpi5": {
+        "spidev_device_path": "/dev/spidev0.0",
+        "gpiod_device_path": "/dev/gpiochip4",
+        "dcx_pin_id": 25,
+        "rst_pin_id": None,
+        "spi_clock_hz": 42_000_000,
+        "spi_data_chunk_size": None,  # Sized by the kernel buffer.
+        "circuit_guide": CIRCUIT_GUIDE,
+    },
+}
+
+SERVER_ADDRESS = "/tmp/ili9341_display_server.sock"
+
+# Number of horizontal bands the screen is split into, one for each client.
+N_CLIENT_BANDS = 4
+
+
+def run_server(config_name):
+    print(f"Starting display server using config '{config_name}' ...")
+    c = HW_CONFIGS[config_name]
+
+    print(c["circuit_guide"])
+    lcd = Ili9341Spidev(
+        spidev_device_path=c["spidev_device_path"],
+        gpiod_device_path=c["gpiod_device_path"],
+        dcx_pin_id=c["dcx_pin_id"],
+        rst_pin_id=c["rst_pin_id"],
+        spi_clock_hz=c["spi_clock_hz"],
+        spi_data_chunk_size=c["spi_data_chunk_size"])
+
+    lcd.clear((0xFF, 0xFF, 0xFF))
+
+    with Ili9341DisplayServer(lcd, address=SERVER_ADDRESS) as server:
+        print(f"Serving on '{server.address}', press Ctrl+C to stop ...")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+        print(f"Presented {server.n_frames} frames.")
+
+
+def run_client(band, duration=10.0, size=20):
+    print(f"Drawing random boxes in band {band} for {duration:.0f}s ...")
+    with Ili9341DisplayClient(SERVER_ADDRESS) as client:
+        height, width = client.framebuff.shape[:2]
+        band_height = height // N_CLIENT_BANDS
+        band_top = band * band_height
+
+        n_frames = 0
+        stop_time = time.time() + duration
+        while time.time() < stop_time:
+            top = band_top + random.randint(0, band_height - size)
+            left = random.randint(0, width - size)
+            client.framebuff[top:(top + size), left:(left + size), :] = (
+                random.randint(0, 255),
+                random.randint(0, 255),
+                random.randint(0, 255))
+
+            # Only this box changed, no need to compare the whole frame.
+            client.present(regions=[(left, top, size, size)])
+            n_frames += 1
+
+        print(f"\t{n_frames / duration:.1f} fps")
+
+
+USAGE = (
+    "USAGE: python3 run_display_server.py serve {} | client {}"
+    .format(
+        "|".join(HW_CONFIGS.keys()),
+        "|".join(str(i) for i in range(N_CLIENT_BANDS))))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(USAGE)
+        sys.exit(1)
+
+    mode, arg = sys.argv[1], sys.argv[2]
+    if mode == "serve" and arg in HW_CONFIGS:
+        run_server(arg)
+    elif mode == "client" and arg.isdigit() and int(arg) < N_CLIENT_BANDS:
+        run_client(int(arg))
+    else:
+        print(USAGE)
+        sys.exit(2)
@@ -0,0 +1,114 @@
+import sys
+sys.path.append("../src/")
+
+import time
+import random
+
+import pyftdi.spi
+
+from ili9341.ili9341_base import ILI9341_TFTWIDTH, ILI9341_TFTHEIGHT
+from ili9341.ili9341_pyftdi import Ili9341Pyftdi
+from ili9341.ili9341_group import Ili9341Group
+
+
+CIRCUIT_GUIDE = """
+# ----------------------------------------------------------------,
+[FT232H] <---> [Display-0] / [Display-1]
+===================-===============================================
+D0       <---> SCLK (SPI-Clock, both displays)
+D1       <---> MOSI (Main-Out-Sub-In, both displays)
+D3       <---> CS/X of display-0
+D4       <---> CS/X of display-1
+D5       <---> DC/X of display-0
+D6       <---> DC/X of display-1
+3.3V+    <---> RST (We are not using reset pin)
+3.3V+    <---> LED (No software illumination control)
+# ----------------------------------------------------------------'
+"""
+
+HW_CONFIGS = {
+    "ft232h-dual": {
+        "pyftdi_interface_path": "ftdi://ftdi:232h/1",
+        "dcx_pin_ids": (5, 6),
+        "priorities": (1, 1),
+        "spi_clock_hz": 30_000_000,
+        "mpsse_batching": True,
+        "circuit_guide": CIRCUIT_GUIDE,
+    },
+
+    "ft232h-dual-prio": {
+        "pyftdi_interface_path": "ftdi://ftdi:232h/1",
+        "dcx_pin_ids": (5, 6),
+        "priorities": (3, 1),
+        "spi_clock_hz": 30_000_000,
+        "mpsse_batching": True,
+        "circuit_guide": CIRCUIT_GUIDE,
+    },
+}
+
+
+def test_random_boxes(group, duration=10.0, size=50):
+    print("Drawing random boxes on all displays for {:.0f}s ...".format(
+        duration))
+    group.reset_stats()
+
+    stop_time = time.time() + duration
+    while time.time() < stop_time:
+        for i, lcd in enumerate(group.displays):
+            top = random.randint(0, ILI9341_TFTHEIGHT - size)
+            left = random.randint(0, ILI9341_TFTWIDTH - size)
+            lcd.framebuff[top:(top + size), left:(left + size), :] = (
+                random.randint(0, 255),
+                random.randint(0, 255),
+                random.randint(0, 255))
+            group.submit(i)
+
+    group.wait()
+    for i, s in enumerate(group.stats()):
+        print("\tDisplay-{}: {:.1f} fps, {} frames sent, {} dropped".format(
+            i, s["fps"], s["frames"], s["dropped"]))
+    print("\tBus utilization: {:.1%}".format(group.bus_utilization))
+
+
+def run_test_procedures(config_name):
+    print(f"Starting Ili9341Group display test using config '{config_name}' ...")
+    c = HW_CONFIGS[config_name]
+
+    print(c["circuit_guide"])
+    ctrl = pyftdi.spi.SpiController(cs_count=len(c["dcx_pin_ids"]))
+    ctrl.configure(c["pyftdi_interface_path"])
+
+    displays = [
+        Ili9341Pyftdi(
+            pyftdi_interface_path=None,
+            dcx_pin_id=dcx_pin_id,
+            spi_clock_hz=c["spi_clock_hz"],
+            spi_data_chunk_size=0,
+            mpsse_batching=c["mpsse_batching"],
+            spi_controller=ctrl,
+            cs=cs)
+        for cs, dcx_pin_id in enumerate(c["dcx_pin_ids"])]
+
+    with Ili9341Group(displays, priorities=c["priorities"]) as group:
+        for lcd in displays:
+            lcd.framebuff[:, :, :] = 0xFF
+        group.update()
+
+        test_random_boxes(group)
+
+
+USAGE = (
+    "USAGE: python3 run_group_display_test.py {}"
+    .format("|".join(HW_CONFIGS.keys())))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(USAGE)
+        sys.exit(1)
+
+    config_name = sys.argv[1]
+    if config_name not in HW_CONFIGS:
+        print(USAGE)
+        sys.exit(2)
+
+    run_test_procedures(config_name)
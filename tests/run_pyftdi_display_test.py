@@ -27,6 +27,17 @@ HW_CONFIGS = {
         "rst_pin_id": None,
         "spi_clock_hz": 42_000_000,
         "spi_data_chunk_size": 4096,
+        "mpsse_batching": False,
+        "circuit_guide": CIRCUIT_GUIDE,
+    },
+
+    "ft232h-batched": {
+        "pyftdi_interface_path": "ftdi://ftdi:232h/1",
+        "dcx_pin_id": 4,
+        "rst_pin_id": None,
+        "spi_clock_hz": 30_000_000,
+        "spi_data_chunk_size": 0,  # Batches are split by the MPSSE encoder.
+        "mpsse_batching": True,
         "circuit_guide": CIRCUIT_GUIDE,
     },
 }
@@ -42,7 +53,8 @@ def run_test_procedures(config_name):
         dcx_pin_id=c["dcx_pin_id"],
         rst_pin_id=c["rst_pin_id"],
         spi_clock_hz=c["spi_clock_hz"],
-        spi_data_chunk_size=c["spi_data_chunk_size"])
+        spi_data_chunk_size=c["spi_data_chunk_size"],
+        mpsse_batching=c["mpsse_batching"])
 
     lcd.clear((0xFF, 0xFF, 0xFF))
 
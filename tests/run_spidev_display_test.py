@@ -27,7 +27,7 @@ HW_CONFIGS = {
         "dcx_pin_id": 25,
         "rst_pin_id": None,
         "spi_clock_hz": 42_000_000,
-        "spi_data_chunk_size": 0,  # No chunking!
+        "spi_data_chunk_size": None,  # Sized by the kernel buffer.
         "circuit_guide": CIRCUIT_GUIDE,
     },
 
@@ -37,7 +37,7 @@ HW_CONFIGS = {
         "dcx_pin_id": 25,
         "rst_pin_id": None,
         "spi_clock_hz": 42_000_000,
-        "spi_data_chunk_size": 0,  # No chunking!
+        "spi_data_chunk_size": None,  # Sized by the kernel buffer.
         "circuit_guide": CIRCUIT_GUIDE,
     },
 
@@ -60,7 +60,7 @@ HW_CONFIGS = {
         # Seems like there is no way around it.
         # Ref: https://forum.up-community.org/discussion/5032/spi-speed-on-up-squared-6000-does-not-go-over-1mhz
         "spi_clock_hz": 20_000_000,
-        "spi_data_chunk_size": 0,
+        "spi_data_chunk_size": None,
         "circuit_guide": CIRCUIT_GUIDE,
     }
 }
@@ -0,0 +1,212 @@
+import sys
+sys.path.append("../src/")
+
+import time
+import random
+
+import cv2
+
+from ili9341.ili9341_base import ILI9341_TFTWIDTH, ILI9341_TFTHEIGHT
+from ili9341.ili9341_sim import Ili9341Sim
+from test_procedures import TEST_RGB_COLORS
+
+
+STAGES = ("convert", "diff", "pack")
+
+
+class BenchmarkSim(Ili9341Sim):
+    """A simulated display which accumulates time spent in each stage of
+    `update()`.
+
+    """
+
+    def __init__(self, **kwargs):
+        self.reset_stage_times()
+        super().__init__(**kwargs)
+
+    def reset_stage_times(self):
+        self.stage_times = {s: 0.0 for s in STAGES}
+
+    def _convert_framebuff(self, framebuff):
+        stime = time.perf_counter()
+        new_data = super()._convert_framebuff(framebuff)
+        self.stage_times["convert"] += time.perf_counter() - stime
+        return new_data
+
+    def _find_updated_areas(self, old_data, new_data):
+        stime = time.perf_counter()
+        areas = super()._find_updated_areas(old_data, new_data)
+        self.stage_times["diff"] += time.perf_counter() - stime
+        return areas
+
+    def _update_partial(self, new_data, x1, y1, x2, y2):
+        stime = time.perf_counter()
+        super()._update_partial(new_data, x1, y1, x2, y2)
+        self.stage_times["pack"] += time.perf_counter() - stime
+
+
+# Workloads. Each one modifies the framebuffer and yields once per frame,
+# mirroring the procedures in `test_procedures.py`.
+# ----------------------------------------------------------------------,
+def workload_fullscreen(lcd, n_frames=40):
+    colors = list(TEST_RGB_COLORS.values())
+    for i in range(n_frames):
+        lcd.framebuff[:, :, :] = colors[i % len(colors)]
+        yield
+
+
+def workload_corner_boxes(lcd, n_frames=40, size=100):
+    xmax = ILI9341_TFTWIDTH
+    ymax = ILI9341_TFTHEIGHT
+    colors = list(TEST_RGB_COLORS.values())
+    boxes = (
+        (0, 0, size, size),
+        (xmax - size, 0, xmax, size),
+        (xmax - size, ymax - size, xmax, ymax),
+        (0, ymax - size, size, ymax),
+        (int((xmax - size)/2), int((ymax - size)/2),
+         int((xmax - size)/2 + size), int((ymax - size)/2 + size)),
+    )
+
+    for i in range(n_frames):
+        x1, y1, x2, y2 = boxes[i % len(boxes)]
+        lcd.framebuff[y1:y2, x1:x2, :] = colors[i % len(colors)]
+        yield
+
+
+def workload_random_boxes(lcd, n_frames=300, size=50):
+    rnd = random.Random(0)
+    for i in range(n_frames):
+        if i % 5 == 0:
+            top = rnd.randint(0, ILI9341_TFTHEIGHT - size//2)
+            left = rnd.randint(0, ILI9341_TFTWIDTH - size//2)
+            bot = top + size
+            right = left + size
+
+        lcd.framebuff[top:bot, left:right, 0] = rnd.randint(0, 255)
+        lcd.framebuff[top:bot, left:right, 1] = rnd.randint(0, 255)
+        lcd.framebuff[top:bot, left:right, 2] = rnd.randint(0, 255)
+        yield
+
+
+def workload_video(lcd, n_frames=300, path="baby_video.mp4"):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError("Failed to open video!")
+
+    # Decode up-front, so that decoding does not pollute the timings.
+    frames = []
+    while len(frames) < n_frames:
+        ret, frame = cap.read()
+        if frame is None:
+            break
+        frames.append(
+            cv2.cvtColor(frame.swapaxes(0, 1), cv2.COLOR_BGR2RGB))
+
+    for frame in frames:
+        lcd.framebuff[:, :, :] = frame
+        yield
+# ----------------------------------------------------------------------'
+
+
+WORKLOADS = {
+    "fullscreen": workload_fullscreen,
+    "corner-boxes": workload_corner_boxes,
+    "random-boxes": workload_random_boxes,
+    "video": workload_video,
+}
+
+
+def benchmark(name, spi_clock_hz, merge_mode, change_detection="diff"):
+    lcd = BenchmarkSim(
+        spi_clock_hz=spi_clock_hz,
+        decode=False,
+        partial_update_merge_mode=merge_mode,
+        change_detection=change_detection)
+
+    lcd.framebuff[:, :, :] = 0
+    lcd.update()
+    lcd.reset_counters()
+    lcd.reset_stage_times()
+
+    n_frames = 0
+    for _ in WORKLOADS[name](lcd):
+        lcd.update()
+        n_frames += 1
+
+    t = {s: lcd.stage_times[s] / n_frames for s in STAGES}
+    cpu_time = sum(t.values())
+    bus_time = lcd.estimated_bus_time() / n_frames
+
+    return {
+        "frames": n_frames,
+        "convert_ms": t["convert"] * 1e3,
+        "diff_ms": t["diff"] * 1e3,
+        "pack_ms": t["pack"] * 1e3,
+        "bytes": lcd.n_bytes / n_frames,
+        "transactions": lcd.n_transactions / n_frames,
+        "dc_writes": lcd.n_dc_writes / n_frames,
+        "bus_ms": bus_time * 1e3,
+        "cpu_fps": 1.0 / cpu_time if cpu_time > 0 else float("inf"),
+        "bus_fps": 1.0 / bus_time if bus_time > 0 else float("inf"),
+        "fps": 1.0 / (cpu_time + bus_time),
+    }
+
+
+REPORT_COLUMNS = (
+    # key, header, format
+    ("frames", "frames", "{:>6d}"),
+    ("convert_ms", "conv-ms", "{:>8.3f}"),
+    ("diff_ms", "diff-ms", "{:>8.3f}"),
+    ("pack_ms", "pack-ms", "{:>8.3f}"),
+    ("bytes", "bytes/frame", "{:>11.0f}"),
+    ("transactions", "txns/frame", "{:>10.1f}"),
+    ("dc_writes", "dc/frame", "{:>8.1f}"),
+    ("bus_ms", "bus-ms", "{:>8.3f}"),
+    ("cpu_fps", "cpu-fps", "{:>8.1f}"),
+    ("bus_fps", "bus-fps", "{:>8.1f}"),
+    ("fps", "fps", "{:>7.1f}"),
+)
+
+
+def print_report(results, spi_clock_hz, merge_mode, change_detection):
+    print(
+        f"Update benchmark at {spi_clock_hz / 1e6:.1f} MHz SPI clock,"
+        f" '{merge_mode}' merge mode, '{change_detection}' change detection:")
+    header = "{:<14s}".format("workload") + " ".join(
+        "{:>{}s}".format(h, len(f.format(0))) for _, h, f in REPORT_COLUMNS)
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        print("{:<14s}".format(name) + " ".join(
+            f.format(r[k]) for k, _, f in REPORT_COLUMNS))
+
+
+USAGE = (
+    "USAGE: python3 run_update_benchmark.py all|{}"
+    " [spi_clock_hz] [merge_mode] [change_detection]"
+    .format("|".join(WORKLOADS.keys())))
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(USAGE)
+        sys.exit(1)
+
+    workload_name = sys.argv[1]
+    if workload_name != "all" and workload_name not in WORKLOADS:
+        print(USAGE)
+        sys.exit(2)
+
+    spi_clock_hz = int(sys.argv[2]) if len(sys.argv) > 2 else 42_000_000
+    merge_mode = sys.argv[3] if len(sys.argv) > 3 else "distance"
+    change_detection = sys.argv[4] if len(sys.argv) > 4 else "diff"
+
+    names = list(WORKLOADS.keys()) if workload_name == "all" else [workload_name]
+    print_report(
+        {
+            name: benchmark(name, spi_clock_hz, merge_mode, change_detection)
+            for name in names
+        },
+        spi_clock_hz,
+        merge_mode,
+        change_detection)
@@ -3,6 +3,7 @@ import time
 import random
 
 from ili9341.ili9341_base import ILI9341_TFTWIDTH, ILI9341_TFTHEIGHT
+from ili9341.ili9341_video import Ili9341VideoPlayer
 
 TEST_RGB_COLORS = {
     "RED": (255, 0, 0),
@@ -58,47 +59,30 @@ def test_display_image(lcd, path="baby_image.jpg"):
     lcd.update()
 
 
-def test_play_video(lcd, path="baby_video.mp4"):
-    lcd.clear()
-
-    cap = cv2.VideoCapture(path)
-    if not cap.isOpened():
-        raise RuntimeError("Failed to open video!")
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if frame is None:
-            break
-
-        lcd.framebuff[:, :, :] = cv2.cvtColor(frame.swapaxes(0, 1), cv2.COLOR_BGR2RGB)
-        lcd.update()
+def print_playback_stats(stats):
+    print("\tPlayed at {:.1f} fps of {:.1f} fps source, {} frames shown,"
+          " {} dropped.".format(
+              stats["fps"], stats["source_fps"], stats["shown"],
+              stats["dropped_decode"] + stats["dropped_prepare"] +
+              stats["dropped_transmit"]))
 
 
-def test_webcam(lcd, webcam_index=0, fps=15, duration=10):
+def test_play_video(lcd, path="baby_video.mp4"):
+    print("Playing video: {} ...".format(path))
     lcd.clear()
 
-    cap = cv2.VideoCapture(webcam_index)
-    if not cap.isOpened():
-        raise RuntimeError("Failed to open webcam!")
+    player = Ili9341VideoPlayer(lcd, path, transpose=True)
+    print_playback_stats(player.play())
+    player.close()
 
-    n_frames = fps * duration
-    i = 0
-    while cap.isOpened() and i < n_frames:
-        stime = time.time() 
 
-        ret, frame = cap.read()
-        frame = cv2.cvtColor(
-            cv2.resize(frame, (ILI9341_TFTWIDTH, ILI9341_TFTHEIGHT)), cv2.COLOR_BGR2RGB)
-        lcd.framebuff[:, :, :] = frame
-        lcd.update()
-
-        # Maintain FPS.
-        etime = time.time()
-        elapsed = etime - stime
-        remaining = max(0.0, 1.0/fps - elapsed)
-        time.sleep(remaining)
+def test_webcam(lcd, webcam_index=0, duration=10):
+    print("Showing webcam {} for {}s ...".format(webcam_index, duration))
+    lcd.clear()
 
-        i += 1
+    player = Ili9341VideoPlayer(lcd, webcam_index)
+    print_playback_stats(player.play(duration=duration))
+    player.close()
 
 
 def test_draw_random_boxes(lcd, fps=60, duration=10, size=50):
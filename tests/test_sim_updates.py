@@ -0,0 +1,256 @@
+"""Check that partial updates leave the simulated panel showing the same image
+as a full repaint of the framebuffer would."""
+
+import numpy as np
+import pytest
+
+from ili9341.ili9341_sim import Ili9341Sim
+from ili9341.ili9341_group import Ili9341Group
+
+
+PALETTE = [(0, 0, 0), (255, 255, 255), (255, 0, 0), (0, 128, 255), (16, 200, 64)]
+
+UPDATE_CONFIGS = [
+    pytest.param({}, id="diff"),
+    pytest.param({"partial_update_merge_mode": "cost"}, id="cost"),
+    pytest.param({"change_detection": "tile_hash"}, id="tile_hash"),
+    pytest.param(
+        {"change_detection": "tile_hash", "tile_size": 4,
+         "partial_update_merge_mode": "cost"},
+        id="tile_hash-4-cost"),
+    pytest.param({"palette": PALETTE}, id="palette"),
+    pytest.param(
+        {"palette": PALETTE, "change_detection": "tile_hash"},
+        id="palette-tile_hash"),
+]
+
+ROTATIONS = (0, 90, 180, 270)
+
+
+# Reference displays by color mode, reused as initializing one takes a while.
+_references = {}
+
+
+def reference_screen(lcd):
+    """Return the panel image of a reference display after repainting the
+    whole framebuffer of `lcd`."""
+    indexed = lcd.palette is not None
+    ref = _references.get(indexed)
+    if ref is None:
+        ref = _references[indexed] = Ili9341Sim(palette=lcd.palette)
+
+    if indexed:
+        ref.set_palette(lcd.palette)
+    if ref.rotation != lcd.rotation:
+        ref.set_rotation(lcd.rotation)
+
+    height, width = lcd.framebuff.shape[:2]
+    ref.framebuff[...] = lcd.framebuff
+    ref.update(regions=[(0, 0, width, height)])
+    return ref.screen()
+
+
+def assert_shows_framebuff(lcd):
+    np.testing.assert_array_equal(lcd.screen(), reference_screen(lcd))
+
+
+def random_color(lcd, rng):
+    if lcd.palette is not None:
+        return rng.integers(0, len(PALETTE))
+    return rng.integers(0, 256, 3)
+
+
+def paint_random_boxes(lcd, rng, n_boxes=3):
+    """Paint boxes of random sizes and colors, returning them as (x, y, w, h)
+    regions."""
+    height, width = lcd.framebuff.shape[:2]
+    regions = []
+    for _ in range(n_boxes):
+        w = rng.integers(1, width // 2)
+        h = rng.integers(1, height // 2)
+        x = rng.integers(0, width - w)
+        y = rng.integers(0, height - h)
+        lcd.framebuff[y:(y + h), x:(x + w)] = random_color(lcd, rng)
+        regions.append((int(x), int(y), int(w), int(h)))
+    return regions
+
+
+@pytest.mark.parametrize("rotation", ROTATIONS)
+@pytest.mark.parametrize("kwargs", UPDATE_CONFIGS)
+def test_updates_match_full_repaint(kwargs, rotation):
+    rng = np.random.default_rng(rotation)
+    lcd = Ili9341Sim(rotation=rotation, **kwargs)
+    lcd.update()
+
+    for _ in range(8):
+        paint_random_boxes(lcd, rng)
+        lcd.update()
+        assert_shows_framebuff(lcd)
+
+    # Nothing left to send.
+    lcd.reset_counters()
+    lcd.update()
+    assert lcd.n_bytes == 0
+
+
+@pytest.mark.parametrize("kwargs", UPDATE_CONFIGS)
+def test_declared_damage_matches_full_repaint(kwargs):
+    rng = np.random.default_rng(1)
+    lcd = Ili9341Sim(**kwargs)
+    lcd.update()
+
+    for _ in range(8):
+        regions = paint_random_boxes(lcd, rng)
+        lcd.update(regions=regions)
+        assert_shows_framebuff(lcd)
+
+
+@pytest.mark.parametrize("rotation", ROTATIONS)
+@pytest.mark.parametrize("kwargs", UPDATE_CONFIGS)
+def test_scroll_matches_full_repaint(kwargs, rotation):
+    rng = np.random.default_rng(2)
+    lcd = Ili9341Sim(rotation=rotation, **kwargs)
+    lcd.set_scroll_area(24, 296)
+    paint_random_boxes(lcd, rng, n_boxes=8)
+    lcd.update()
+
+    for n_lines in (7, -13, 16, 1, 100):
+        lcd.scroll(n_lines)
+        assert_shows_framebuff(lcd)
+
+        # Changes pending while scrolling are moved along, and still sent.
+        paint_random_boxes(lcd, rng)
+        lcd.scroll(n_lines)
+        lcd.update()
+        assert_shows_framebuff(lcd)
+
+
+@pytest.mark.parametrize("rotation", ROTATIONS)
+def test_scroll_detection_matches_full_repaint(rotation):
+    rng = np.random.default_rng(3)
+    lcd = Ili9341Sim(rotation=rotation, scroll_detection=True)
+    paint_random_boxes(lcd, rng, n_boxes=8)
+    lcd.update()
+
+    axis = 1 if lcd.framebuff.shape[1] == 320 else 0
+    for n_lines in (5, -9, 30):
+        lcd.framebuff[...] = np.roll(lcd.framebuff, -n_lines, axis=axis)
+        lcd.update()
+        assert_shows_framebuff(lcd)
+
+
+@pytest.mark.parametrize("kwargs", UPDATE_CONFIGS)
+def test_set_rotation_matches_full_repaint(kwargs):
+    rng = np.random.default_rng(4)
+    lcd = Ili9341Sim(**kwargs)
+    paint_random_boxes(lcd, rng)
+    lcd.update()
+
+    for rotation in (90, 180, 270, 0):
+        lcd.set_rotation(rotation)
+        paint_random_boxes(lcd, rng)
+        lcd.update()
+        assert_shows_framebuff(lcd)
+
+
+@pytest.mark.parametrize("kwargs", UPDATE_CONFIGS)
+def test_blit_matches_full_repaint(kwargs):
+    rng = np.random.default_rng(5)
+    lcd = Ili9341Sim(**kwargs)
+    lcd.update()
+
+    height, width = lcd.framebuff.shape[:2]
+    for _ in range(8):
+        # Blitting over areas with unsent changes must not lose them.
+        paint_random_boxes(lcd, rng)
+
+        size = tuple(rng.integers(1, 40, 2))
+        if lcd.palette is not None:
+            image = rng.integers(0, len(PALETTE), size, dtype=np.uint8)
+        else:
+            image = rng.integers(0, 256, size + (3,), dtype=np.uint8)
+        lcd.blit(
+            image, int(rng.integers(-20, width)), int(rng.integers(-20, height)))
+
+        lcd.update()
+        assert_shows_framebuff(lcd)
+
+
+@pytest.mark.parametrize("change_detection", ("diff", "tile_hash"))
+def test_set_palette_matches_full_repaint(change_detection):
+    rng = np.random.default_rng(6)
+    lcd = Ili9341Sim(palette=PALETTE, change_detection=change_detection)
+    paint_random_boxes(lcd, rng, n_boxes=8)
+    lcd.update()
+
+    lcd.set_palette(PALETTE[::-1])
+    lcd.update()
+    assert_shows_framebuff(lcd)
+
+
+@pytest.mark.parametrize("kwargs", UPDATE_CONFIGS)
+def test_update_async_matches_full_repaint(kwargs):
+    rng = np.random.default_rng(7)
+    lcd = Ili9341Sim(async_update_policy="block", **kwargs)
+    try:
+        for _ in range(8):
+            paint_random_boxes(lcd, rng)
+            lcd.update_async()
+        lcd.wait_async()
+        assert_shows_framebuff(lcd)
+    finally:
+        lcd.stop_async()
+
+
+def test_group_updates_match_full_repaint():
+    rng = np.random.default_rng(9)
+    displays = [
+        Ili9341Sim(),
+        Ili9341Sim(change_detection="tile_hash"),
+        Ili9341Sim(palette=PALETTE)]
+
+    with Ili9341Group(displays, priorities=[1, 2, 1]) as group:
+        for _ in range(8):
+            # Frames of several displays are prepared and sent back to back.
+            for i, lcd in enumerate(displays):
+                paint_random_boxes(lcd, rng)
+                group.submit(i)
+            group.wait()
+
+            for lcd in displays:
+                assert_shows_framebuff(lcd)
+
+        regions = [paint_random_boxes(lcd, rng) for lcd in displays]
+        group.update(regions)
+        for lcd in displays:
+            assert_shows_framebuff(lcd)
+
+
+@pytest.mark.parametrize("tile_size, pixels", [
+    (16, [(0, 3), (0, 7)]),
+    (4, [(0, 3), (1, 3)]),
+])
+def test_tile_hash_detects_top_bit_flips(tile_size, pixels):
+    # These pairs of changes cancelled out in the weighted sum of words
+    # tile digests used to be.
+    lcd = Ili9341Sim(change_detection="tile_hash", tile_size=tile_size)
+    lcd.update()
+
+    for y, x in pixels:
+        lcd.framebuff[y, x] = (0, 16, 0)
+    lcd.reset_counters()
+    lcd.update()
+
+    assert lcd.n_bytes > 0
+    assert_shows_framebuff(lcd)
+
+
+@pytest.mark.parametrize("palette", (None, PALETTE))
+def test_tile_hash_keeps_no_sent_frame(palette):
+    lcd = Ili9341Sim(palette=palette, change_detection="tile_hash")
+    lcd.update()
+    paint_random_boxes(lcd, np.random.default_rng(8))
+    lcd.update()
+
+    assert lcd._old_data is None
+    assert lcd._rgb565_buffs is None